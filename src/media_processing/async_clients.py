@@ -0,0 +1,87 @@
+# %%
+import asyncio
+import os
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any, Self
+
+import httpx
+import stamina
+
+
+@dataclass(frozen=True)
+class RequestLimits:
+    max_concurrency: int = 8
+    timeout_seconds: float = 120.0
+    attempts: int = 3
+
+
+class AsyncClientPool:
+    """API clients for one event loop, sharing a single pooled HTTP client.
+
+    `call` bounds the requests in flight, times each attempt out and backs
+    off with stamina between attempts. The clients' own retries are turned
+    off so that failures are only retried here.
+    """
+
+    def __init__(self, limits: RequestLimits | None = None):
+        limits = limits or RequestLimits()
+        self.limits = limits
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=limits.max_concurrency,
+                max_keepalive_connections=limits.max_concurrency,
+            ),
+            timeout=httpx.Timeout(limits.timeout_seconds),
+        )
+        self._semaphore = asyncio.Semaphore(limits.max_concurrency)
+        self._clients: dict[tuple[str, str | None], Any] = {}
+
+    def openai(self, base_url: str | None) -> Any:
+        from openai import AsyncOpenAI
+
+        key = ("openai", base_url)
+        if key not in self._clients:
+            self._clients[key] = AsyncOpenAI(
+                base_url=base_url, http_client=self.http_client, max_retries=0
+            )
+        return self._clients[key]
+
+    def together(self, base_url: str | None) -> Any:
+        from together import AsyncTogether
+
+        # The Together SDK manages its own HTTP session, so it only shares
+        # the concurrency limit and timeout
+        key = ("together", base_url)
+        if key not in self._clients:
+            self._clients[key] = AsyncTogether(
+                api_key=os.environ.get("TOGETHER_API_KEY"),
+                base_url=base_url,
+                timeout=self.limits.timeout_seconds,
+                max_retries=0,
+            )
+        return self._clients[key]
+
+    async def call[T](
+        self,
+        request: Callable[[], Awaitable[T]],
+        on: type[Exception] | tuple[type[Exception], ...],
+    ) -> T:
+        async for attempt in stamina.retry_context(
+            on=(TimeoutError, *(on if isinstance(on, tuple) else (on,))),
+            attempts=self.limits.attempts,
+        ):
+            with attempt:
+                async with self._semaphore:
+                    async with asyncio.timeout(self.limits.timeout_seconds):
+                        return await request()
+        raise AssertionError("unreachable")
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
@@ -0,0 +1,68 @@
+# %%
+import runpy
+import sys
+
+# Subcommand -> (module run as `__main__`, summary)
+commands: dict[str, tuple[str, str]] = {
+    "slideshow": (
+        "media_processing.slideshow_from_markdown",
+        "Convert a markdown article into a slideshow",
+    ),
+    "slideshow-batch": (
+        "media_processing.slideshow_batch",
+        "Convert a directory or manifest of articles",
+    ),
+    "slideshow-benchmark": (
+        "media_processing.slideshow_benchmark",
+        "Benchmark the slideshow pipeline offline",
+    ),
+    "transcribe": ("media_processing.transcribe", "Transcribe an audio file"),
+    "tts": ("media_processing.mp3_from_tts", "Synthesize speech into an mp3 file"),
+    "worker": (
+        "media_processing.worker",
+        "Serve transcribe and tts jobs over a Unix socket",
+    ),
+    "startup-benchmark": (
+        "media_processing.startup_benchmark",
+        "Measure CLI startup time against a budget",
+    ),
+}
+
+
+def usage() -> str:
+    width = max(len(name) for name in commands)
+    return "\n".join(
+        [
+            "usage: media-processing <command> [args...]",
+            "",
+            "commands:",
+            *(
+                f"  {name:<{width}}  {summary}"
+                for name, (_, summary) in commands.items()
+            ),
+            "",
+            "Run `media-processing <command> --help` for the command's arguments.",
+        ]
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Run the module of a subcommand as `__main__`.
+
+    Only that module is imported, and modules parse their arguments before
+    their heavy imports, so `--help` and invalid arguments return quickly.
+    """
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) == 0 or args[0] in ("-h", "--help"):
+        print(usage())
+        sys.exit(0 if len(args) > 0 else 2)
+    if args[0] not in commands:
+        print(f"Unknown command: {args[0]}\n\n{usage()}", file=sys.stderr)
+        sys.exit(2)
+
+    sys.argv = [sys.argv[0], *args[1:]]
+    runpy.run_module(commands[args[0]][0], run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
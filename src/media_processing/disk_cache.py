@@ -0,0 +1,82 @@
+# %%
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+
+class CacheMissError(LookupError):
+    pass
+
+
+def hash_key(value: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
+
+
+class DiskCache:
+    """Content-addressed byte store with size-bounded LRU eviction.
+
+    Entries are plain files named by key; their modification time doubles as
+    the LRU clock, so recency survives across processes. Eviction frees down
+    to `low_water_ratio` of `max_bytes`, so the directory is only listed and
+    sorted once per many writes. A read-only cache never writes, touches or
+    evicts anything.
+    """
+
+    low_water_ratio = 0.9
+
+    def __init__(self, directory: str | Path, max_bytes: int, read_only: bool = False):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if not read_only:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._total_bytes = sum(p.stat().st_size for p in self._entries())
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def _entries(self) -> list[Path]:
+        if not self.directory.is_dir():
+            return []
+        return [*self.directory.glob("*.bin")]
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            if not self.read_only:
+                os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another thread or process
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if self.read_only:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        with self._lock:
+            old_size = path.stat().st_size if path.exists() else 0
+            tmp_path.replace(path)
+            self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        stats = sorted(
+            ((p, p.stat()) for p in self._entries()), key=lambda e: e[1].st_mtime
+        )
+        low_water_bytes = self.max_bytes * self.low_water_ratio
+        for path, stat in stats:
+            if self._total_bytes <= low_water_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._total_bytes -= stat.st_size
@@ -1,4 +1,12 @@
 # %%
+import json
+import sys
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from functools import cache
+from pathlib import Path
+from typing import Any, TextIO
+
 from llama_index.core.instrumentation import get_dispatcher
 from llama_index.core.instrumentation.event_handlers import BaseEventHandler
 from llama_index.core.instrumentation.events import BaseEvent
@@ -49,7 +57,193 @@ from llama_index.core.instrumentation.events.synthesis import (
     SynthesizeEndEvent,
     SynthesizeStartEvent,
 )
-from treelib import Tree
+from llama_index.core.instrumentation.span.simple import SimpleSpan
+from llama_index.core.instrumentation.span_handlers import (
+    BaseSpanHandler,
+    NullSpanHandler,
+)
+from pydantic import PrivateAttr
+
+EventFormatter = Callable[[Any], list[object]]
+
+event_formatters: dict[type[BaseEvent], EventFormatter] = {
+    AgentRunStepStartEvent: lambda e: [e.task_id, e.step, e.input],
+    AgentRunStepEndEvent: lambda e: [e.step_output],
+    AgentChatWithStepStartEvent: lambda e: [e.user_msg],
+    AgentChatWithStepEndEvent: lambda e: [e.response],
+    AgentToolCallEvent: lambda e: [
+        e.arguments,
+        e.tool.name,
+        e.tool.description,
+        e.tool.to_openai_tool(),
+    ],
+    StreamChatDeltaReceivedEvent: lambda e: [e.delta],
+    StreamChatErrorEvent: lambda e: [e.exception],
+    EmbeddingStartEvent: lambda e: [e.model_dict],
+    # avoid printing all embeddings
+    EmbeddingEndEvent: lambda e: [e.chunks, e.embeddings[0][:5]],
+    LLMPredictStartEvent: lambda e: [e.template, e.template_args],
+    LLMPredictEndEvent: lambda e: [e.output],
+    LLMStructuredPredictStartEvent: lambda e: [
+        e.template,
+        e.template_args,
+        e.output_cls,
+    ],
+    LLMStructuredPredictEndEvent: lambda e: [e.output],
+    LLMCompletionStartEvent: lambda e: [e.model_dict, e.prompt, e.additional_kwargs],
+    LLMCompletionEndEvent: lambda e: [e.response, e.prompt],
+    LLMChatInProgressEvent: lambda e: [e.messages, e.response],
+    LLMChatStartEvent: lambda e: [e.messages, e.additional_kwargs, e.model_dict],
+    LLMChatEndEvent: lambda e: [e.messages, e.response],
+    RetrievalStartEvent: lambda e: [e.str_or_query_bundle],
+    RetrievalEndEvent: lambda e: [e.str_or_query_bundle, e.nodes],
+    ReRankStartEvent: lambda e: [e.query, e.nodes, e.top_n, e.model_name],
+    ReRankEndEvent: lambda e: [e.nodes],
+    QueryStartEvent: lambda e: [e.query],
+    QueryEndEvent: lambda e: [e.response, e.query],
+    SpanDropEvent: lambda e: [e.err_str],
+    SynthesizeStartEvent: lambda e: [e.query],
+    SynthesizeEndEvent: lambda e: [e.response, e.query],
+    GetResponseStartEvent: lambda e: [e.query_str],
+}
+
+
+@cache
+def _formatter_for(event_type: type[BaseEvent]) -> EventFormatter | None:
+    return next(
+        (event_formatters[t] for t in event_type.__mro__ if t in event_formatters),
+        None,
+    )
+
+
+def format_event(event: BaseEvent) -> str:
+    # all events have these attributes
+    lines: list[object] = [
+        event.id_,
+        event.timestamp,
+        event.span_id,
+        f"Event type: {event.class_name()}",
+    ]
+    # event specific attributes
+    formatter = _formatter_for(type(event))
+    if formatter is not None:
+        lines += formatter(event)
+    return "\n".join(map(str, lines))
+
+
+def group_events_by_span(events: Iterable[BaseEvent]) -> dict[str, list[BaseEvent]]:
+    """Bucket events by span in a single pass, keeping arrival order."""
+    events_by_span: dict[str, list[BaseEvent]] = {}
+    for event in events:
+        if event.span_id is not None:
+            events_by_span.setdefault(event.span_id, []).append(event)
+    return events_by_span
+
+
+def format_event_span_trees(events: Iterable[BaseEvent]) -> Iterator[str]:
+    for span, span_events in group_events_by_span(events).items():
+        yield f"{span} (SPAN)"
+        for i, event in enumerate(span_events):
+            branch = "└── " if i == len(span_events) - 1 else "├── "
+            yield f"{branch}{event.class_name()}: {event.id_}"
+        yield ""
+
+
+def print_event_span_trees(events: Iterable[BaseEvent]) -> None:
+    for line in format_event_span_trees(events):
+        print(line)
+
+
+def write_chrome_trace(
+    events: Iterable[BaseEvent],
+    file: TextIO,
+    span_parents: Mapping[str, str | None] | None = None,
+) -> None:
+    """Stream events as Chrome trace JSON, loadable in Perfetto.
+
+    Each event is an instant and each span a complete slice from its first
+    to its last event. With `span_parents`, as collected by
+    `SpanParentHandler`, spans share the track of their root span and their
+    slices are widened to cover their children, so Perfetto nests them.
+    Without it, every span gets a track of its own.
+    """
+    parents = span_parents or {}
+    roots: dict[str, str] = {}
+    root_tracks: dict[str, int] = {}
+    span_bounds: dict[str, tuple[float, float]] = {}
+    separator = ""
+
+    def root_of(span: str) -> str:
+        # Each span's root is resolved once and then shared by its descendants
+        path = []
+        while span not in roots:
+            parent = parents.get(span)
+            if parent is None:
+                roots[span] = span
+            else:
+                path.append(span)
+                span = parent
+        for descendant in path:
+            roots[descendant] = roots[span]
+        return roots[span]
+
+    def write(record: dict[str, Any]) -> None:
+        nonlocal separator
+        file.write(separator)
+        file.write(json.dumps(record, default=str))
+        separator = ",\n"
+
+    file.write('{"traceEvents": [\n')
+    for event in events:
+        span = event.span_id or "(no span)"
+        track = root_tracks.setdefault(root_of(span), len(root_tracks) + 1)
+        ts = event.timestamp.timestamp() * 1e6
+        first, last = span_bounds.get(span, (ts, ts))
+        span_bounds[span] = (min(first, ts), max(last, ts))
+        write(
+            {
+                "name": event.class_name(),
+                "ph": "i",
+                "s": "t",
+                "ts": ts,
+                "pid": 1,
+                "tid": track,
+                "args": {"id": event.id_},
+            }
+        )
+
+    for span, (first, last) in [*span_bounds.items()]:
+        parent = parents.get(span)
+        while parent is not None:
+            parent_first, parent_last = span_bounds.get(parent, (first, last))
+            if span in span_bounds and parent_first <= first and last <= parent_last:
+                break
+            first, last = min(parent_first, first), max(parent_last, last)
+            span_bounds[parent] = (first, last)
+            span, parent = parent, parents.get(parent)
+
+    for root, track in root_tracks.items():
+        write(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": track,
+                "args": {"name": root},
+            }
+        )
+    for span, (first, last) in span_bounds.items():
+        write(
+            {
+                "name": span,
+                "ph": "X",
+                "ts": first,
+                "dur": last - first,
+                "pid": 1,
+                "tid": root_tracks[root_of(span)],
+            }
+        )
+    file.write("\n]}\n")
 
 
 class ExampleEventHandler(BaseEventHandler):
@@ -91,150 +285,126 @@ class ExampleEventHandler(BaseEventHandler):
     def handle(self, event: BaseEvent, **kwargs) -> None:
         """Logic for handling event."""
         print("-----------------------")
-        # all events have these attributes
-        print(event.id_)
-        print(event.timestamp)
-        print(event.span_id)
-
-        # event specific attributes
-        print(f"Event type: {event.class_name()}")
-        if isinstance(event, AgentRunStepStartEvent):
-            print(event.task_id)
-            print(event.step)
-            print(event.input)
-        if isinstance(event, AgentRunStepEndEvent):
-            print(event.step_output)
-        if isinstance(event, AgentChatWithStepStartEvent):
-            print(event.user_msg)
-        if isinstance(event, AgentChatWithStepEndEvent):
-            print(event.response)
-        if isinstance(event, AgentToolCallEvent):
-            print(event.arguments)
-            print(event.tool.name)
-            print(event.tool.description)
-            print(event.tool.to_openai_tool())
-        if isinstance(event, StreamChatDeltaReceivedEvent):
-            print(event.delta)
-        if isinstance(event, StreamChatErrorEvent):
-            print(event.exception)
-        if isinstance(event, EmbeddingStartEvent):
-            print(event.model_dict)
-        if isinstance(event, EmbeddingEndEvent):
-            print(event.chunks)
-            print(event.embeddings[0][:5])  # avoid printing all embeddings
-        if isinstance(event, LLMPredictStartEvent):
-            print(event.template)
-            print(event.template_args)
-        if isinstance(event, LLMPredictEndEvent):
-            print(event.output)
-        if isinstance(event, LLMStructuredPredictStartEvent):
-            print(event.template)
-            print(event.template_args)
-            print(event.output_cls)
-        if isinstance(event, LLMStructuredPredictEndEvent):
-            print(event.output)
-        if isinstance(event, LLMCompletionStartEvent):
-            print(event.model_dict)
-            print(event.prompt)
-            print(event.additional_kwargs)
-        if isinstance(event, LLMCompletionEndEvent):
-            print(event.response)
-            print(event.prompt)
-        if isinstance(event, LLMChatInProgressEvent):
-            print(event.messages)
-            print(event.response)
-        if isinstance(event, LLMChatStartEvent):
-            print(event.messages)
-            print(event.additional_kwargs)
-            print(event.model_dict)
-        if isinstance(event, LLMChatEndEvent):
-            print(event.messages)
-            print(event.response)
-        if isinstance(event, RetrievalStartEvent):
-            print(event.str_or_query_bundle)
-        if isinstance(event, RetrievalEndEvent):
-            print(event.str_or_query_bundle)
-            print(event.nodes)
-        if isinstance(event, ReRankStartEvent):
-            print(event.query)
-            print(event.nodes)
-            print(event.top_n)
-            print(event.model_name)
-        if isinstance(event, ReRankEndEvent):
-            print(event.nodes)
-        if isinstance(event, QueryStartEvent):
-            print(event.query)
-        if isinstance(event, QueryEndEvent):
-            print(event.response)
-            print(event.query)
-        if isinstance(event, SpanDropEvent):
-            print(event.err_str)
-        if isinstance(event, SynthesizeStartEvent):
-            print(event.query)
-        if isinstance(event, SynthesizeEndEvent):
-            print(event.response)
-            print(event.query)
-        if isinstance(event, GetResponseStartEvent):
-            print(event.query_str)
-        if isinstance(event, GetResponseStartEvent):
-            print(event.query_str)
-
+        print(format_event(event))
         self.events.append(event)
         print("-----------------------")
 
-    def _get_events_by_span(self) -> dict[str, list[BaseEvent]]:
-        events_by_span: dict[str, list[BaseEvent]] = {}
-        for event in self.events:
-            if event.span_id in events_by_span:
-                events_by_span[event.span_id].append(event)
-            elif event.span_id is not None:
-                events_by_span[event.span_id] = [event]
-        return events_by_span
-
-    def _get_event_span_trees(self) -> list[Tree]:
-        events_by_span = self._get_events_by_span()
-
-        trees = []
-        tree = Tree()
-
-        for span, sorted_events in events_by_span.items():
-            # create root node i.e. span node
-            tree.create_node(
-                tag=f"{span} (SPAN)",
-                identifier=span,
-                parent=None,
-                data=sorted_events[0].timestamp,
-            )
-
-            for event in sorted_events:
-                tree.create_node(
-                    tag=f"{event.class_name()}: {event.id_}",
-                    identifier=event.id_,
-                    parent=event.span_id,
-                    data=event.timestamp,
-                )
-
-            trees.append(tree)
-            tree = Tree()
-        return trees
-
     def print_event_span_trees(self) -> None:
         """Method for viewing trace trees."""
-        trees = self._get_event_span_trees()
-        for tree in trees:
-            print(tree.show(stdout=False, sorting=True, key=lambda node: node.data))
-            print("")
+        print_event_span_trees(self.events)
+
+
+class TraceEventHandler(BaseEventHandler):
+    """Collects events into a bounded ring buffer without printing.
+
+    Handling an event is a single append; formatting is deferred until the
+    trace is dumped, and the oldest events are dropped past `max_events`.
+    """
+
+    max_events: int = 10_000
+    _events: deque[BaseEvent] = PrivateAttr()
+
+    def model_post_init(self, context: Any, /) -> None:
+        self._events = deque(maxlen=self.max_events)
+
+    @classmethod
+    def class_name(cls) -> str:
+        """Class name."""
+        return "TraceEventHandler"
+
+    def handle(self, event: BaseEvent, **kwargs) -> None:
+        self._events.append(event)
+
+    @property
+    def events(self) -> list[BaseEvent]:
+        return [*self._events]
+
+    def clear(self) -> None:
+        self._events.clear()
+
+    def print_event_span_trees(self) -> None:
+        print_event_span_trees([*self._events])
+
+    def write_chrome_trace(
+        self, path: str | Path, span_parents: Mapping[str, str | None] | None = None
+    ) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            write_chrome_trace([*self._events], f, span_parents)
+
+    def dump(self, file: TextIO = sys.stdout) -> None:
+        for event in [*self._events]:
+            print("-----------------------", file=file)
+            print(format_event(event), file=file)
+        print("-----------------------", file=file)
+
+
+class SpanParentHandler(BaseSpanHandler[SimpleSpan]):
+    """Records the parent of each span, for nesting spans in traces.
+
+    Like `TraceEventHandler`, it keeps only the latest `max_spans` links.
+    """
+
+    max_spans: int = 10_000
+    _parents: OrderedDict[str, str | None] = PrivateAttr(default_factory=OrderedDict)
+
+    @classmethod
+    def class_name(cls) -> str:
+        """Class name."""
+        return "SpanParentHandler"
+
+    def new_span(
+        self,
+        id_: str,
+        bound_args: Any,
+        instance: Any | None = None,
+        parent_span_id: str | None = None,
+        tags: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> SimpleSpan:
+        with self.lock:
+            self._parents[id_] = parent_span_id
+            while len(self._parents) > self.max_spans:
+                self._parents.popitem(last=False)
+        return SimpleSpan(id_=id_, parent_id=parent_span_id)
+
+    def prepare_to_exit_span(
+        self,
+        id_: str,
+        bound_args: Any,
+        instance: Any | None = None,
+        result: Any | None = None,
+        **kwargs: Any,
+    ) -> SimpleSpan | None:
+        return self.open_spans.get(id_)
+
+    def prepare_to_drop_span(
+        self,
+        id_: str,
+        bound_args: Any,
+        instance: Any | None = None,
+        err: BaseException | None = None,
+        **kwargs: Any,
+    ) -> SimpleSpan | None:
+        return self.open_spans.get(id_)
+
+    @property
+    def parents(self) -> dict[str, str | None]:
+        with self.lock:
+            return dict(self._parents)
 
 
 main_event_handler = ExampleEventHandler()
 
 
-def start():
+def start(*handlers: BaseEventHandler, span_handlers: Iterable[BaseSpanHandler] = ()):
     root_dispatcher = get_dispatcher()
     root_dispatcher.event_handlers = []
-    root_dispatcher.add_event_handler(main_event_handler)
+    for handler in handlers or [main_event_handler]:
+        root_dispatcher.add_event_handler(handler)
+    root_dispatcher.span_handlers = [NullSpanHandler(), *span_handlers]
 
 
 def stop():
     root_dispatcher = get_dispatcher()
     root_dispatcher.event_handlers = []
+    root_dispatcher.span_handlers = [NullSpanHandler()]
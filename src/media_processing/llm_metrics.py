@@ -0,0 +1,221 @@
+# %%
+import json
+import math
+import threading
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import stamina.instrumentation
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events import BaseEvent
+from llama_index.core.instrumentation.events.exception import ExceptionEvent
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMChatInProgressEvent,
+    LLMChatStartEvent,
+)
+from pydantic import PrivateAttr
+
+latency_buckets = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, math.inf)
+
+
+@dataclass(frozen=True)
+class LLMCallMetrics:
+    span_id: str | None
+    model: str
+    latency_seconds: float
+    prompt_tokens: int | None
+    completion_tokens: int | None
+    total_tokens: int | None
+    # The caller closed the stream before the provider finished
+    stopped_early: bool = False
+
+
+def _usage_value(raw: Any, name: str) -> int | None:
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None
+    return usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class LLMMetricsHandler(BaseEventHandler):
+    """Pairs chat start and end events per span into per-call metrics.
+
+    A stream closed early ends with an `ExceptionEvent` instead of an end
+    event; it is recorded with the last response that streamed in. Retries
+    are not dispatcher events; `install_retry_hook` counts them from
+    stamina's instrumentation instead.
+    """
+
+    _starts: dict[str | None, tuple[datetime, str]] = PrivateAttr(default_factory=dict)
+    _last_responses: dict[str | None, Any] = PrivateAttr(default_factory=dict)
+    _calls: list[LLMCallMetrics] = PrivateAttr(default_factory=list)
+    _retries: Counter[str] = PrivateAttr(default_factory=Counter)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        """Class name."""
+        return "LLMMetricsHandler"
+
+    def handle(self, event: BaseEvent, **kwargs) -> None:
+        if isinstance(event, LLMChatStartEvent):
+            model = str(event.model_dict.get("model", "unknown"))
+            with self._lock:
+                self._starts[event.span_id] = (event.timestamp, model)
+        elif isinstance(event, LLMChatInProgressEvent):
+            with self._lock:
+                if event.span_id in self._starts:
+                    self._last_responses[event.span_id] = event.response
+        elif isinstance(event, LLMChatEndEvent):
+            self._end_call(event, event.response, stopped_early=False)
+        elif isinstance(event, ExceptionEvent):
+            with self._lock:
+                if event.span_id not in self._last_responses:
+                    # Failed before anything streamed in
+                    self._starts.pop(event.span_id, None)
+                    return
+            self._end_call(event, None, stopped_early=True)
+
+    def _end_call(self, event: BaseEvent, response: Any, stopped_early: bool) -> None:
+        with self._lock:
+            start = self._starts.pop(event.span_id, None)
+            last_response = self._last_responses.pop(event.span_id, None)
+        if start is None:
+            return
+        started_at, model = start
+        response = response or last_response
+        raw = None if response is None else response.raw
+        call = LLMCallMetrics(
+            span_id=event.span_id,
+            model=model,
+            latency_seconds=(event.timestamp - started_at).total_seconds(),
+            prompt_tokens=_usage_value(raw, "prompt_tokens"),
+            completion_tokens=_usage_value(raw, "completion_tokens"),
+            total_tokens=_usage_value(raw, "total_tokens"),
+            stopped_early=stopped_early,
+        )
+        with self._lock:
+            self._calls.append(call)
+
+    def record_retry(self, details: stamina.instrumentation.RetryDetails) -> None:
+        with self._lock:
+            self._retries[details.name] += 1
+
+    def install_retry_hook(self) -> None:
+        stamina.instrumentation.set_on_retry_hooks(
+            [*stamina.instrumentation.get_on_retry_hooks(), self.record_retry]
+        )
+
+    @property
+    def calls(self) -> list[LLMCallMetrics]:
+        with self._lock:
+            return [*self._calls]
+
+    @property
+    def retries(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._retries)
+
+    def summary(self) -> dict[str, dict[str, float | int]]:
+        by_model: dict[str, list[LLMCallMetrics]] = {}
+        for call in self.calls:
+            by_model.setdefault(call.model, []).append(call)
+        return {
+            model: {
+                "calls": len(calls),
+                "latency_p50_seconds": percentile(
+                    [c.latency_seconds for c in calls], 0.5
+                ),
+                "latency_p99_seconds": percentile(
+                    [c.latency_seconds for c in calls], 0.99
+                ),
+                "prompt_tokens": sum(c.prompt_tokens or 0 for c in calls),
+                "completion_tokens": sum(c.completion_tokens or 0 for c in calls),
+            }
+            for model, calls in by_model.items()
+        }
+
+    def write_jsonl(self, path: str | Path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for call in self.calls:
+                f.write(json.dumps({"type": "call", **asdict(call)}) + "\n")
+            for name, count in self.retries.items():
+                f.write(json.dumps({"type": "retry", "name": name, "count": count}))
+                f.write("\n")
+            for model, stats in self.summary().items():
+                f.write(json.dumps({"type": "summary", "model": model, **stats}))
+                f.write("\n")
+
+    def write_prometheus(self, path: str | Path) -> None:
+        summary = self.summary()
+        lines = [
+            "# HELP llm_chat_latency_seconds Latency of LLM chat calls.",
+            "# TYPE llm_chat_latency_seconds histogram",
+        ]
+        calls = self.calls
+        models = sorted({c.model for c in calls})
+        for model in models:
+            latencies = [c.latency_seconds for c in calls if c.model == model]
+            for bound in latency_buckets:
+                le = "+Inf" if math.isinf(bound) else str(bound)
+                count = sum(1 for latency in latencies if latency <= bound)
+                labels = f'model="{model}",le="{le}"'
+                lines.append(f"llm_chat_latency_seconds_bucket{{{labels}}} {count}")
+            lines.append(
+                f'llm_chat_latency_seconds_sum{{model="{model}"}} {sum(latencies)}'
+            )
+            lines.append(
+                f'llm_chat_latency_seconds_count{{model="{model}"}} {len(latencies)}'
+            )
+
+        lines += [
+            "# HELP llm_chat_latency_quantile_seconds Latency percentiles.",
+            "# TYPE llm_chat_latency_quantile_seconds gauge",
+        ]
+        for model, stats in summary.items():
+            for quantile, key in (
+                ("0.5", "latency_p50_seconds"),
+                ("0.99", "latency_p99_seconds"),
+            ):
+                labels = f'model="{model}",quantile="{quantile}"'
+                lines.append(
+                    f"llm_chat_latency_quantile_seconds{{{labels}}} {stats[key]}"
+                )
+
+        lines += [
+            "# HELP llm_chat_tokens_total Tokens used by LLM chat calls.",
+            "# TYPE llm_chat_tokens_total counter",
+        ]
+        for model, stats in summary.items():
+            for kind in ("prompt", "completion"):
+                labels = f'model="{model}",kind="{kind}"'
+                lines.append(
+                    f"llm_chat_tokens_total{{{labels}}} {stats[f'{kind}_tokens']}"
+                )
+
+        lines += [
+            "# HELP llm_retries_total Retries scheduled by stamina.",
+            "# TYPE llm_retries_total counter",
+        ]
+        for name, count in self.retries.items():
+            lines.append(f'llm_retries_total{{name="{name}"}} {count}')
+
+        Path(path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    def write(self, path: str | Path) -> None:
+        """Write Prometheus text for `.prom` paths and JSONL otherwise."""
+        if Path(path).suffix == ".prom":
+            self.write_prometheus(path)
+        else:
+            self.write_jsonl(path)
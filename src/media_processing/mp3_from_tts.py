@@ -13,6 +13,11 @@ class BaseArgs:
     voice: str
     speed: float
     base_url: str | None
+    workers: int
+    max_segment_chars: int
+    cache_dir: str | None
+    cache_max_bytes: int
+    worker_socket: str | None
 
 
 def validate_mp3_suffix(path: str) -> str:
@@ -28,6 +33,11 @@ class MainArgs(Tap):
     voice: str  # Voice to use for speech synthesis
     speed: float = 1.0  # Speech speed
     base_url: str | None = None  # API Base URL
+    workers: int = 1  # Segments synthesized concurrently (1 = single request)
+    max_segment_chars: int = 400  # Upper bound for sentences packed into a segment
+    cache_dir: str | None = None  # Directory for cached segment audio
+    cache_max_bytes: int = 1 << 30  # Size limit of the segment audio cache
+    worker_socket: str | None = None  # Forward the job to a running worker
 
     def process_args(self) -> None:
         super().process_args()
@@ -41,26 +51,50 @@ g_main_args = BaseArgs(
     voice="af_sarah",
     speed=1.0,
     base_url="http://localhost:8880/v1",
+    workers=1,
+    max_segment_chars=400,
+    cache_dir=None,
+    cache_max_bytes=1 << 30,
+    worker_socket=None,
 )
 if __name__ == "__main__" and "ipykernel" not in sys.modules:
     g_main_args = MainArgs().parse_args()
+    if g_main_args.worker_socket is not None:
+        from media_processing import worker
+
+        worker.submit_job(g_main_args.worker_socket, "tts", g_main_args, BaseArgs)
+        sys.exit(0)
 
 # %%
-from collections.abc import Generator
+import asyncio
+import re
+from collections import deque
+from collections.abc import AsyncGenerator, Generator
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, cast
 
+import openai
 from openai import OpenAI
 
+import media_processing.async_clients as ac
+import media_processing.disk_cache as dc
+
 
 def mp3_from_tts(
-    text: str, model: str, voice: str, speed: float, base_url: str | None
+    text: str,
+    model: str,
+    voice: str,
+    speed: float,
+    base_url: str | None,
+    client: OpenAI | None = None,
 ) -> Generator[bytes, None, None]:
     if not text.strip():
         yield b""
         return
 
-    with OpenAI(base_url=base_url).audio.speech.with_streaming_response.create(
+    client = client or OpenAI(base_url=base_url)
+    with client.audio.speech.with_streaming_response.create(
         model=model,
         voice=cast(Any, voice),
         input=text,
@@ -70,18 +104,297 @@ def mp3_from_tts(
         yield from response.iter_bytes(chunk_size=4096)
 
 
-if __name__ == "__main__":
-    with open(g_main_args.in_path) as f:
-        g_text = f.read()
-    g_output_path = Path(g_main_args.out_path)
-    g_output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(g_output_path, "wb") as f:
-        for g_chunk in mp3_from_tts(
-            text=g_text,
-            model=g_main_args.model,
-            voice=g_main_args.voice,
-            speed=g_main_args.speed,
-            base_url=g_main_args.base_url,
+def segment_text(text: str, max_chars: int) -> list[str]:
+    """Split text into paragraphs, packing whole sentences up to `max_chars`."""
+    segments: list[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        current = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", " ".join(paragraph.split())):
+            if len(current) > 0 and len(current) + 1 + len(sentence) > max_chars:
+                segments.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}".strip()
+        if len(current) > 0:
+            segments.append(current)
+    return segments
+
+
+def strip_id3_tags(data: bytes) -> bytes:
+    """Drop ID3 tags so MP3 segments concatenate into one frame stream."""
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (
+            (data[6] & 0x7F) << 21
+            | (data[7] & 0x7F) << 14
+            | (data[8] & 0x7F) << 7
+            | (data[9] & 0x7F)
+        )
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer :]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+# Layer III bitrates in kbit/s and sample rates in Hz, by MPEG version bits
+_layer3_bitrates = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_sample_rates = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+
+def strip_vbr_header(data: bytes) -> bytes:
+    """Drop a leading Xing, Info or VBRI frame from an MP3 frame stream.
+
+    Encoders put the stream's frame count in this silent first frame. In
+    concatenated segments, players would read the first segment's count as
+    the whole file's and get duration and seeking wrong.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return data
+    version = (data[1] >> 3) & 3
+    layer = (data[1] >> 1) & 3
+    bitrate_index = data[2] >> 4
+    sample_rate_index = (data[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return data
+
+    bitrate = _layer3_bitrates[3 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = _sample_rates[version][sample_rate_index]
+    padding = (data[2] >> 1) & 1
+    frame_length = (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+    mono = data[3] >> 6 == 3
+    side_info_length = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+    crc_length = 0 if data[1] & 1 else 2
+    xing_offset = 4 + crc_length + side_info_length
+    if (
+        data[xing_offset : xing_offset + 4] in (b"Xing", b"Info")
+        or data[36:40] == b"VBRI"
+    ):
+        return data[frame_length:]
+    return data
+
+
+def mp3_frames(data: bytes) -> bytes:
+    """Reduce an MP3 file to frames that concatenate into one stream."""
+    return strip_vbr_header(strip_id3_tags(data))
+
+
+def synthesize_segment(
+    client: OpenAI, text: str, model: str, voice: str, speed: float
+) -> bytes:
+    with client.audio.speech.with_streaming_response.create(
+        model=model,
+        voice=cast(Any, voice),
+        input=text,
+        speed=speed,
+        response_format="mp3",
+    ) as response:
+        return mp3_frames(response.read())
+
+
+def segment_cache_key(text: str, model: str, voice: str, speed: float) -> str:
+    return dc.hash_key(
+        {
+            "text": text,
+            "model": model,
+            "voice": voice,
+            "speed": speed,
+            "format": "mp3_frames",
+        }
+    )
+
+
+def synthesize_segment_cached(
+    client: OpenAI,
+    cache: dc.DiskCache | None,
+    text: str,
+    model: str,
+    voice: str,
+    speed: float,
+) -> bytes:
+    if cache is None:
+        return synthesize_segment(client, text, model, voice, speed)
+
+    key = segment_cache_key(text, model, voice, speed)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    data = synthesize_segment(client, text, model, voice, speed)
+    cache.put(key, data)
+    return data
+
+
+def mp3_from_tts_segmented(
+    text: str,
+    model: str,
+    voice: str,
+    speed: float,
+    base_url: str | None,
+    workers: int,
+    max_segment_chars: int,
+    cache: dc.DiskCache | None = None,
+    client: OpenAI | None = None,
+) -> Generator[bytes, None, None]:
+    """Synthesize segments concurrently, yielding them in order.
+
+    At most `2 * workers` segments are in flight, so a slow consumer does not
+    make finished audio pile up in memory. Segments found in `cache` are
+    spliced in without a request.
+    """
+    segments = segment_text(text, max_segment_chars)
+    if len(segments) == 0:
+        yield b""
+        return
+
+    client = client or OpenAI(base_url=base_url)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future[bytes]] = deque()
+        for segment in segments:
+            pending.append(
+                executor.submit(
+                    synthesize_segment_cached,
+                    client,
+                    cache,
+                    segment,
+                    model,
+                    voice,
+                    speed,
+                )
+            )
+            while len(pending) >= 2 * workers or (
+                len(pending) > 0 and pending[0].done()
+            ):
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+# Failures worth another attempt; other API errors are the request's fault
+retryable_openai_errors = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+async def synthesize_segment_async(
+    pool: ac.AsyncClientPool,
+    cache: dc.DiskCache | None,
+    text: str,
+    model: str,
+    voice: str,
+    speed: float,
+    base_url: str | None,
+) -> bytes:
+    key = segment_cache_key(text, model, voice, speed)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return cached
+
+    client = pool.openai(base_url)
+
+    async def request() -> bytes:
+        async with client.audio.speech.with_streaming_response.create(
+            model=model,
+            voice=cast(Any, voice),
+            input=text,
+            speed=speed,
+            response_format="mp3",
+        ) as response:
+            return mp3_frames(await response.read())
+
+    data = await pool.call(request, on=retryable_openai_errors)
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, data)
+    return data
+
+
+async def mp3_from_tts_async(
+    text: str,
+    model: str,
+    voice: str,
+    speed: float,
+    pool: ac.AsyncClientPool,
+    base_url: str | None = None,
+    max_segment_chars: int = 400,
+    cache: dc.DiskCache | None = None,
+) -> AsyncGenerator[bytes, None]:
+    """Async counterpart of `mp3_from_tts_segmented` on a shared client pool.
+
+    Requests are bounded by the pool; at most twice its concurrency limit
+    of segments are buffered ahead of the consumer.
+    """
+    segments = segment_text(text, max_segment_chars)
+    if len(segments) == 0:
+        yield b""
+        return
+
+    lookahead = 2 * pool.limits.max_concurrency
+    pending: deque[asyncio.Task[bytes]] = deque()
+    try:
+        for segment in segments:
+            pending.append(
+                asyncio.create_task(
+                    synthesize_segment_async(
+                        pool, cache, segment, model, voice, speed, base_url
+                    )
+                )
+            )
+            while len(pending) >= lookahead or (len(pending) > 0 and pending[0].done()):
+                yield await pending.popleft()
+        while len(pending) > 0:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def mp3_file_from_tts(
+    args: BaseArgs | MainArgs,
+    client: OpenAI | None = None,
+    cache: dc.DiskCache | None = None,
+) -> Path:
+    with open(args.in_path) as f:
+        text = f.read()
+    if cache is None and args.cache_dir is not None:
+        cache = dc.DiskCache(args.cache_dir, args.cache_max_bytes)
+    output_path = Path(args.out_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "wb") as f:
+        for chunk in (
+            mp3_from_tts(
+                text=text,
+                model=args.model,
+                voice=args.voice,
+                speed=args.speed,
+                base_url=args.base_url,
+                client=client,
+            )
+            if args.workers <= 1 and cache is None
+            else mp3_from_tts_segmented(
+                text=text,
+                model=args.model,
+                voice=args.voice,
+                speed=args.speed,
+                base_url=args.base_url,
+                workers=args.workers,
+                max_segment_chars=args.max_segment_chars,
+                cache=cache,
+                client=client,
+            )
         ):
-            f.write(g_chunk)
+            f.write(chunk)
+    return output_path
+
+
+if __name__ == "__main__":
+    mp3_file_from_tts(g_main_args)
 # %%
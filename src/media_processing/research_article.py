@@ -1,17 +1,28 @@
 import re
-from collections.abc import Iterable, Sequence
-from dataclasses import dataclass
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass, field
 from enum import StrEnum
-from typing import Self
+from functools import cached_property
+from itertools import accumulate, pairwise
+from pathlib import Path
+from typing import TYPE_CHECKING, Self
 
-from llama_index.core.schema import BaseNode, TextNode
-from rapidfuzz import fuzz
+from markdown_it import MarkdownIt
+from rapidfuzz import fuzz, process
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode
 
 
 class SectionType(StrEnum):
     pass
 
 
+section_type_min_score = 80
+quote_min_score = 90
+
+
 class CommonPrimarySectionType(SectionType):
     ABSTRACT = "abstract"
     INTRODUCTION = "introduction"
@@ -40,6 +51,10 @@ class Section:
                 pass
             case _:
                 raise ValueError("Unexpected section text format.")
+        return cls.from_heading(title, content)
+
+    @classmethod
+    def from_heading(cls, title: str, content: str) -> Self:
         match title.split():
             case ["#" | "##" | "###", second]:
                 level, clean_title = 1, second
@@ -58,14 +73,19 @@ class Section:
             fuzz.partial_ratio(
                 section_type.lower(), self.title.lower() if self.title else ""
             )
-            >= 80
+            >= section_type_min_score
         )
 
     def to_markdown(self) -> str:
         return f"## {self.title}\n\n{self.content}"
 
+    def char_count(self) -> int:
+        return len(self.title or "") + len(self.content)
+
+
+def sections_from_nodes(nodes: Iterable["BaseNode"]) -> "list[Section]":
+    from llama_index.core.schema import TextNode
 
-def sections_from_nodes(nodes: Iterable[BaseNode]) -> "list[Section]":
     return [
         Section.from_text(cleaned)
         for node in nodes
@@ -77,37 +97,245 @@ def sections_from_nodes(nodes: Iterable[BaseNode]) -> "list[Section]":
     ]
 
 
+# Headings and fences are all that decide where sections start; without the
+# other block rules, `#` lines in HTML blocks split sections as they do in
+# `MarkdownNodeParser`.
+section_parser = (
+    MarkdownIt("zero").enable(["fence", "heading"]).disable(["inline", "text_join"])
+)
+
+
+def read_markdown(path: str | Path) -> str:
+    return Path(path).read_text(encoding="utf-8")
+
+
+def iter_sections_from_markdown(text: str) -> Iterator[Section]:
+    """Split markdown into sections at ATX headings, like `MarkdownNodeParser`.
+
+    Block tokens tell real headings from `#` lines in code fences; inline
+    parsing is skipped. Text before the first heading becomes a section of
+    its own, as it would as a node.
+    """
+    text = text.replace("\r\n", "\n")
+    lines = text.split("\n")
+    heading_lines = [
+        token.map[0]
+        for token in section_parser.parse(text)
+        if token.type == "heading_open"
+        and token.map is not None
+        and lines[token.map[0]].startswith("#")
+    ]
+    if len(heading_lines) == 0 or heading_lines[0] > 0:
+        preamble = "\n".join(lines[: heading_lines[0] if heading_lines else None])
+        cleaned = re.sub(r"\n{3,}", "\n\n", preamble.strip())
+        if len(cleaned) > 0:
+            yield Section.from_text(cleaned)
+    for start, end in pairwise([*heading_lines, len(lines)]):
+        # Only blank lines are stripped, so indented code keeps its indent
+        content = re.sub(r"^\s*\n", "", "\n".join(lines[start + 1 : end])).rstrip()
+        yield Section.from_heading(
+            lines[start].strip(), re.sub(r"\n{3,}", "\n\n", content)
+        )
+
+
+def sections_from_markdown(text: str) -> list[Section]:
+    return [*iter_sections_from_markdown(text)]
+
+
 def markdown_from_sections(sections: Iterable[Section]) -> str:
     return "\n\n".join(s.to_markdown() for s in sections)
 
 
+def classify_sections(
+    sections: Sequence[Section], section_types: Sequence[SectionType]
+) -> list[frozenset[SectionType]]:
+    """Match every section title against every type in one `cdist` call.
+
+    Equivalent to `Section.matches_type` for each pair.
+    """
+    if len(sections) == 0 or len(section_types) == 0:
+        return [frozenset() for _ in sections]
+
+    matches = (
+        process.cdist(
+            [t.lower() for t in section_types],
+            [(s.title or "").lower() for s in sections],
+            scorer=fuzz.partial_ratio,
+            score_cutoff=section_type_min_score,
+            workers=-1,
+        )
+        >= section_type_min_score
+    )
+    return [
+        frozenset(
+            t for t, matched in zip(section_types, column, strict=True) if matched
+        )
+        for column in matches.T
+    ]
+
+
+def build_type_index(
+    sections: Sequence[Section], section_types: Sequence[SectionType]
+) -> dict[SectionType, tuple[int, ...]]:
+    classified = classify_sections(sections, section_types)
+    return {
+        t: tuple(i for i, types in enumerate(classified) if t in types)
+        for t in section_types
+    }
+
+
+@dataclass(frozen=True)
+class QuoteMatch:
+    section_index: int
+    # Offsets into `WindowAligner.text`
+    start: int
+    end: int
+    score: float
+
+
+class WindowAligner:
+    """Locates quoted text in a window of section markdowns.
+
+    Exact quotes are found with `str.find`; paraphrased ones fall back to
+    rapidfuzz's `partial_ratio_alignment`. Offsets map back to sections by
+    binary search.
+    """
+
+    def __init__(self, markdowns: Sequence[str], first_index: int):
+        self.text = "\n\n".join(markdowns)
+        self.first_index = first_index
+        self._offsets = [0, *accumulate(len(m) + len("\n\n") for m in markdowns)]
+
+    def section_at(self, offset: int) -> int:
+        return self.first_index + bisect_right(self._offsets, offset) - 1
+
+    def locate(self, quote: str, search_from: int = 0) -> QuoteMatch | None:
+        quote = quote.strip()
+        if len(quote) == 0:
+            return None
+
+        start = self.text.find(quote, search_from)
+        if start >= 0:
+            return QuoteMatch(
+                self.section_at(start), start, start + len(quote), score=100.0
+            )
+
+        haystack = self.text[search_from:]
+        if len(quote) > len(haystack):
+            return None
+        alignment = fuzz.partial_ratio_alignment(
+            quote, haystack, score_cutoff=quote_min_score
+        )
+        if alignment is None:
+            return None
+        start = search_from + alignment.dest_start
+        return QuoteMatch(
+            self.section_at(start),
+            start,
+            search_from + alignment.dest_end,
+            alignment.score,
+        )
+
+
 @dataclass(frozen=True)
 class ResearchArticle:
     primary_sections: Sequence[Section]
     supportive_sections: Sequence[Section]
+    # Section indices per type: `CommonPrimarySectionType` entries index
+    # `primary_sections`, `SupportiveSectionType` entries `supportive_sections`.
+    type_index: Mapping[SectionType, Sequence[int]] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        object.__setattr__(
+            self,
+            "type_index",
+            build_type_index(self.primary_sections, [*CommonPrimarySectionType])
+            | build_type_index(self.supportive_sections, [*SupportiveSectionType]),
+        )
 
     @classmethod
     def from_sections(cls, sections: Iterable[Section]) -> Self:
+        all_sections = [*sections]
         primary = []
         supportive = []
 
-        for section in sections:
-            (
-                supportive
-                if any(section.matches_type(t) for t in SupportiveSectionType)
-                else primary
-            ).append(section)
+        for section, types in zip(
+            all_sections,
+            classify_sections(all_sections, [*SupportiveSectionType]),
+            strict=True,
+        ):
+            (supportive if len(types) > 0 else primary).append(section)
 
         return cls(primary_sections=primary, supportive_sections=supportive)
 
-    def get_primary_opening_sections(self) -> list[Section]:
-        sections: list[Section] = []
-        for section in self.primary_sections:
-            sections.append(section)
-            if section.matches_type(CommonPrimarySectionType.INTRODUCTION):
-                break
+    def sections_of_type(self, section_type: SectionType) -> list[Section]:
+        sections = (
+            self.supportive_sections
+            if isinstance(section_type, SupportiveSectionType)
+            else self.primary_sections
+        )
+        return [sections[i] for i in self.type_index.get(section_type, ())]
+
+    def first_index_of_type(self, section_type: SectionType) -> int | None:
+        return next(iter(self.type_index.get(section_type, ())), None)
+
+    @cached_property
+    def primary_char_offsets(self) -> list[int]:
+        """Prefix sums of `Section.char_count` over `primary_sections`."""
+        return [0, *accumulate(s.char_count() for s in self.primary_sections)]
+
+    @cached_property
+    def primary_level1_indices(self) -> list[int]:
+        return [i for i, s in enumerate(self.primary_sections) if s.level == 1]
+
+    @cached_property
+    def primary_markdowns(self) -> tuple[str, ...]:
+        return tuple(s.to_markdown() for s in self.primary_sections)
+
+    def primary_markdown(self, indices: range) -> str:
+        return "\n\n".join(self.primary_markdowns[indices.start : indices.stop])
+
+    def primary_aligner(self, indices: range) -> WindowAligner:
+        return WindowAligner(
+            self.primary_markdowns[indices.start : indices.stop], indices.start
+        )
 
-        return sections
+    def window_until_threshold(
+        self, start: int, min_chars: int, level_1_lookahead_chars: int
+    ) -> range:
+        """Index range `get_sections_until_threshold` would select from `start`.
+
+        Uses binary search over the prefix sums and level-1 positions instead
+        of walking a copied tail of the section list.
+        """
+        offsets = self.primary_char_offsets
+        level1 = self.primary_level1_indices
+        count = len(self.primary_sections)
+        if start >= count:
+            return range(count, count)
+
+        next_level1 = bisect_right(level1, start)
+        end = min(
+            level1[next_level1] if next_level1 < len(level1) else count,
+            bisect_left(offsets, offsets[start] + min_chars, start, count),
+        )
+
+        lookahead_level1 = bisect_left(level1, end)
+        if lookahead_level1 < len(level1):
+            candidate = level1[lookahead_level1]
+            if offsets[candidate] - offsets[end] <= level_1_lookahead_chars:
+                end = candidate
+        return range(start, end)
+
+    def get_primary_opening_sections(self) -> list[Section]:
+        intro_index = self.first_index_of_type(CommonPrimarySectionType.INTRODUCTION)
+        return [
+            *self.primary_sections[
+                : len(self.primary_sections) if intro_index is None else intro_index + 1
+            ]
+        ]
 
 
 def get_sections_until_threshold(
@@ -119,7 +347,7 @@ def get_sections_until_threshold(
         if (section.level == 1 and len(sections) > 0) or total_chars >= min_chars:
             break
         sections.append(section)
-        total_chars += len(section.title or "") + len(section.content)
+        total_chars += section.char_count()
 
     rest_sections = all_sections[len(sections) :]
     chars_until_level1 = 0
@@ -129,5 +357,5 @@ def get_sections_until_threshold(
         if next_section.level == 1:
             sections += rest_sections[:i]
             break
-        chars_until_level1 += len(next_section.title or "") + len(next_section.content)
+        chars_until_level1 += next_section.char_count()
     return sections
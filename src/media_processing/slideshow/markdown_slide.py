@@ -1,19 +1,20 @@
 # %%
-from collections.abc import Iterable, Sequence
+import io
+import threading
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import dataclass
+from functools import cache, cached_property, lru_cache
 
 # %%
-from itertools import chain
-from typing import ClassVar, Self
+from typing import ClassVar, Self, TextIO
 
-import regex
 from markdown_it import MarkdownIt
 from markdown_it.token import Token
 from markdown_it.tree import SyntaxTreeNode
 from mdformat.plugins import PARSER_EXTENSIONS
 from mdformat.renderer import MDRenderer
 from mdit_py_plugins.front_matter import front_matter_plugin
-from more_itertools import intersperse
+from more_itertools import intersperse, last
 
 from media_processing.prompt import triple_quote
 
@@ -22,28 +23,79 @@ class JsonObjectString(str):
     pass
 
 
+def iter_json_object_spans(text: str, pos: int = 0) -> Iterator[tuple[int, int]]:
+    """Yield `(start, end)` of each top-level brace-balanced object in `text`.
+
+    Braces are paired in one pass with a stack of open positions; a pair that
+    closes around earlier pairs replaces them, and an opening brace that is
+    never closed is skipped. Quotes only delimit strings while a brace is
+    open, so apostrophes in the surrounding prose do not confuse the scanner.
+    """
+    open_starts: list[int] = []
+    spans: list[tuple[int, int]] = []
+    in_string = False
+    escaped = False
+    for i in range(pos, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"' and len(open_starts) > 0:
+            in_string = True
+        elif char == "{":
+            open_starts.append(i)
+        elif char == "}" and len(open_starts) > 0:
+            start = open_starts.pop()
+            while len(spans) > 0 and spans[-1][0] > start:
+                spans.pop()
+            spans.append((start, i + 1))
+            if len(open_starts) == 0:
+                # Nothing left open can enclose these spans anymore
+                yield from spans
+                spans.clear()
+
+    yield from spans
+
+
+def rfind_json_object_span(text: str) -> tuple[int, int] | None:
+    """Return the span of the last complete brace-balanced object in `text`."""
+    return last(iter_json_object_spans(text), None)
+
+
 @dataclass(frozen=True)
 class ContentNode:
     node: SyntaxTreeNode
 
-    def to_segments(self) -> Sequence[str | JsonObjectString]:
-        content: list[str | JsonObjectString] = []
+    def iter_segments(self) -> Iterator[str | JsonObjectString]:
         for node in self.node.walk():
             stripped = node.content.strip()
-            json_object_pattern = r"{(?:[^{}]|(?R))*}"
             last_end = 0
 
-            for match in regex.finditer(json_object_pattern, stripped):
-                substr = stripped[last_end : match.start()]
+            for start, end in iter_json_object_spans(stripped):
+                substr = stripped[last_end:start]
                 if len(substr) > 0:
-                    content.append(substr)
-                content.append(JsonObjectString(match.group()))
-                last_end = match.end()
+                    yield substr
+                yield JsonObjectString(stripped[start:end])
+                last_end = end
 
             if last_end < len(stripped):
-                content.append(stripped[last_end:].strip())
+                yield stripped[last_end:].strip()
 
-        return content
+    def to_segments(self) -> Sequence[str | JsonObjectString]:
+        return [*self.iter_segments()]
+
+    def last_json_object(self) -> JsonObjectString | None:
+        for node in reversed([*self.node.walk()]):
+            stripped = node.content.strip()
+            span = rfind_json_object_span(stripped)
+            if span is not None:
+                start, end = span
+                return JsonObjectString(stripped[start:end])
+        return None
 
 
 @dataclass(frozen=True)
@@ -77,15 +129,33 @@ def ensure_types(node_types: Iterable[str], node: SyntaxTreeNode):
 
 @dataclass(frozen=True)
 class MarkdownSlide:
+    """A parsed slide, shared between threads once parsed.
+
+    Parsing and the memo are thread-safe. Rendering is not: the front matter
+    extension of mdformat renders with one module-level YAML instance, so
+    all rendering is serialized by `render_lock`.
+    """
+
     title: Title
     main_contents: Sequence[MainContent]
     note: Note | None
     front_matter: FrontMatter | None
 
     parser: ClassVar[MarkdownIt] = MarkdownIt().use(front_matter_plugin)
+    renderer: ClassVar[MDRenderer] = MDRenderer(parser=parser)
+    render_options: ClassVar[dict] = {
+        "parser_extension": [
+            PARSER_EXTENSIONS["simple_breaks"],
+            PARSER_EXTENSIONS["frontmatter"],
+        ]
+    }
+    separator_tokens: ClassVar[list[Token]] = parser.parse("---")
+    render_lock: ClassVar[threading.Lock] = threading.Lock()
 
     @classmethod
+    @lru_cache(maxsize=4096)
     def from_markdown(cls, markdown: str) -> Self:
+        """Parse a slide; results are memoized, which is safe as slides are frozen."""
         tree = SyntaxTreeNode(cls.parser.parse(f"---\n{markdown.strip('\n\r-')}"))
         first_node, second_node, *rest_nodes = tree
         expected_first = ensure_types(["front_matter", "hr"], first_node)
@@ -120,16 +190,9 @@ class MarkdownSlide:
 
     @classmethod
     def render_tokens(cls, tokens: Iterable[Token]) -> str:
-        return MDRenderer(parser=cls.parser).render(
-            [*tokens],
-            {
-                "parser_extension": [
-                    PARSER_EXTENSIONS["simple_breaks"],
-                    PARSER_EXTENSIONS["frontmatter"],
-                ]
-            },
-            {},
-        )
+        tokens = [*tokens]
+        with cls.render_lock:
+            return cls.renderer.render(tokens, cls.render_options, {})
 
     def to_tokens(self) -> list[Token]:
         nodes: list[SyntaxTreeNode] = []
@@ -142,20 +205,57 @@ class MarkdownSlide:
 
         return [token for node in nodes for token in node.to_tokens()]
 
-    def to_markdown(self) -> str:
+    @cached_property
+    def markdown(self) -> str:
         return self.render_tokens(self.to_tokens())
 
+    def to_markdown(self) -> str:
+        return self.markdown
+
 
 def slides_to_context_prompt(slides: Iterable[MarkdownSlide]) -> str:
-    return f"These are the current slides:\n{
-        triple_quote(
-            MarkdownSlide.render_tokens(
-                chain(
-                    *intersperse(
-                        MarkdownSlide.parser.parse('---'),
-                        [s.to_tokens() for s in slides],
-                    )
-                )
-            )
-        )
-    }"
+    return rendered_slides_to_context_prompt(s.markdown for s in slides)
+
+
+@cache
+def separator_markdown() -> str:
+    return MarkdownSlide.render_tokens(MarkdownSlide.separator_tokens).rstrip("\n")
+
+
+def join_rendered_slides(markdowns: Iterable[str]) -> str:
+    slides = (m.rstrip("\n") for m in markdowns)
+    return "\n\n".join(intersperse(separator_markdown(), slides)) + "\n"
+
+
+def rendered_slides_to_context_prompt(markdowns: Iterable[str]) -> str:
+    return f"These are the current slides:\n{triple_quote(join_rendered_slides(markdowns))}"
+
+
+class DeckWriter:
+    """Appends slides to a deck as they arrive, matching `render_deck` output.
+
+    Slides with front matter need no separator. The file is flushed after
+    each slide, so a crashed run leaves a readable partial deck.
+    """
+
+    def __init__(self, file: TextIO):
+        self.file = file
+        self._empty = True
+
+    def write(self, slide: MarkdownSlide):
+        if not self._empty:
+            self.file.write("\n")
+            if slide.front_matter is None:
+                self.file.write(f"{separator_markdown()}\n\n")
+        self.file.write(f"{slide.markdown.rstrip('\n')}\n")
+        self.file.flush()
+        self._empty = False
+
+
+def render_deck(slides: Iterable[MarkdownSlide]) -> str:
+    """Render slides as one deck; slides with front matter need no separator."""
+    buffer = io.StringIO()
+    writer = DeckWriter(buffer)
+    for slide in slides:
+        writer.write(slide)
+    return buffer.getvalue()
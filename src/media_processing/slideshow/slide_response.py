@@ -1,29 +1,32 @@
 # %%
+import re
+from collections.abc import Iterator
 from dataclasses import dataclass
 from typing import Self
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 import media_processing.slideshow.markdown_slide as ms
 
 
+class MissingReferenceError(ValueError):
+    """The slide parsed, but its note is missing or has no reference JSON."""
+
+
 class SlideReferenceStatus(BaseModel):
     start: str
     end: str
 
     @classmethod
     def from_note(cls, note: ms.Note) -> Self:
+        json_object = note.last_json_object()
+        if json_object is None:
+            raise MissingReferenceError("No JSON object found in note")
         try:
-            return cls.model_validate_json(
-                next(
-                    c
-                    for c in reversed(note.to_segments())
-                    if isinstance(c, ms.JsonObjectString)
-                )
-            )
-        except StopIteration as e:
-            print(note.to_segments())
-            raise e
+            return cls.model_validate_json(json_object)
+        except ValidationError:
+            # The prompt's own example ends with a trailing comma
+            return cls.model_validate_json(re.sub(r",(\s*)\}$", r"\1}", json_object))
 
 
 @dataclass(frozen=True)
@@ -44,5 +47,116 @@ class SlideResponse:
             ),
         )
 
+    @classmethod
+    def from_repaired_markdown(cls, markdown: str) -> Self:
+        """Parse a reply, falling back to `repair_candidates` if it is malformed.
+
+        The reply is cut after the first complete response, dropping further
+        slides. A missing reference is not repaired here; it raises
+        `MissingReferenceError` so the caller can ask for just the JSON.
+        """
+        end = find_response_end(markdown)
+        if end is not None:
+            markdown = markdown[:end]
+        try:
+            return cls._from_single_slide_markdown(markdown)
+        except MissingReferenceError:
+            raise
+        except ValueError as error:
+            for candidate in repair_candidates(markdown):
+                try:
+                    return cls._from_single_slide_markdown(candidate)
+                except ValueError:
+                    continue
+            raise error
+
+    @classmethod
+    def _from_single_slide_markdown(cls, markdown: str) -> Self:
+        # A slide followed by `---` and another slide parses as front matter
+        response = cls.from_markdown(markdown)
+        front_matter = response.slide.front_matter
+        if front_matter is not None and _slide_line.search(front_matter.node.content):
+            raise ValueError("Front matter holds a slide; the reply has several slides")
+        return response
+
+
+_code_fence = re.compile(r"```[\w-]*\n(.*?)\n?```", re.DOTALL)
+_title_line = re.compile(r"^#[^\n]*$", re.MULTILINE)
+_next_slide_start = re.compile(r"^(?:---[ \t]*|# .*)$", re.MULTILINE)
+_slide_line = re.compile(r"^(?:#{1,6}[ \t]|<!--)", re.MULTILINE)
+_subheading_line = re.compile(r"^#{2,6}[ \t]+(.*?)[ \t#]*$", re.MULTILINE)
+
+
+def repair_candidates(markdown: str) -> Iterator[str]:
+    """Yield deterministic fixes of common formatting slips, mildest first.
+
+    The slide is first cut out of surrounding chatter, a code fence or the
+    further slides some models write after it; a `---` left in place would
+    be parsed as the end of front matter. Subheadings inside the slide body
+    then become bold paragraphs.
+    """
+    text = markdown.strip()
+    fenced = _code_fence.search(text)
+    if fenced is not None:
+        text = fenced.group(1).strip()
+
+    title = _title_line.search(text)
+    if title is None:
+        return
+    title_end = title.end()
+    if not text.startswith("---"):
+        text = text[title.start() :]
+        title_end -= title.start()
+    next_slide = _next_slide_start.search(text, title_end)
+    if next_slide is not None:
+        text = text[: next_slide.start()].rstrip()
+    if text != markdown.strip():
+        yield text
+
+    body = _subheading_line.sub(r"**\1**", text[title_end:])
+    if body != text[title_end:]:
+        yield text[:title_end] + body
+
+
+def with_reference(markdown: str, follow_up_reply: str) -> str:
+    """Merge a follow-up reply into the slide's note.
+
+    A reply to a slide without a note is appended as the note; otherwise
+    only its last JSON object is inserted before the first note closes.
+    """
+    note_end = markdown.find("-->")
+    note_start = follow_up_reply.find("<!--")
+    reply_end = follow_up_reply.rfind("-->")
+    if note_end < 0 and 0 <= note_start < reply_end:
+        note = follow_up_reply[note_start : reply_end + len("-->")]
+        return f"{markdown.rstrip()}\n\n{note}"
+
+    span = ms.rfind_json_object_span(follow_up_reply)
+    if span is None:
+        raise MissingReferenceError("No JSON object found in the follow-up reply")
+    json_object = follow_up_reply[span[0] : span[1]]
+    if note_end < 0:
+        return f"{markdown.rstrip()}\n\n<!--\n{json_object}\n-->"
+    return f"{markdown[:note_end].rstrip()}\n{json_object}\n{markdown[note_end:]}"
+
+
+def find_response_end(markdown: str, search_from: int = 0) -> int | None:
+    """Return where a complete slide response ends in a partial reply.
+
+    A response is complete once a note closes after `search_from` with the
+    reference JSON inside it; anything the model writes afterwards is unused.
+    """
+    end = markdown.find("-->", search_from)
+    while end >= 0:
+        end += len("-->")
+        try:
+            response = SlideResponse.from_markdown(markdown[:end])
+        except ValueError:
+            response = None
+        if response is not None and response.reference_status is not None:
+            return end
+        end = markdown.find("-->", end)
+    return None
+
 
 # %%
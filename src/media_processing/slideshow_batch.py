@@ -0,0 +1,196 @@
+# %%
+import sys
+from dataclasses import asdict, dataclass
+
+from tap import Tap
+
+
+@dataclass(frozen=True)
+class BaseArgs:
+    in_path: str
+    out_dir: str
+    example_source_path: str
+    example_overview_slide_path: str
+    max_concurrent_articles: int
+    max_concurrent_llm_calls: int
+    pipeline_workers: int
+    cache_dir: str | None
+    cache_max_bytes: int
+    cache_replay: bool
+    tokenizer: str
+    context_token_budget: int
+    stream_responses: bool
+
+
+class MainArgs(Tap):
+    in_path: str  # Directory of markdown articles, or a manifest listing their paths
+    out_dir: str  # Directory for per-article outputs and the summary report
+    example_source_path: str  # Path to example source text
+    example_overview_slide_path: str  # Path to example slide format
+    max_concurrent_articles: int = 4  # Articles converted at the same time
+    max_concurrent_llm_calls: int = 8  # LLM requests in flight across all articles
+    pipeline_workers: int = 1  # Level-1 sections drafted concurrently per article
+    cache_dir: str | None = None  # Directory for the LLM response cache
+    cache_max_bytes: int = 1 << 30  # Size limit of the LLM response cache
+    cache_replay: bool = False  # Only serve cached responses, never call the LLM
+    tokenizer: str = "Xenova/claude-tokenizer"  # Tokenizer file or hub id
+    context_token_budget: int = 3000  # Token budget for the existing slides
+    stream_responses: bool = False  # Stream replies and stop after the reference JSON
+
+
+g_main_args = BaseArgs(
+    in_path="../../test/fixture/batch",
+    out_dir="../../test/output/batch",
+    example_source_path="../../test/fixture/scientific_article_markdown_1.md",
+    example_overview_slide_path="../../test/fixture/markdown_to_slideshow/scientific_article_1_overview_slide.md",
+    max_concurrent_articles=4,
+    max_concurrent_llm_calls=8,
+    pipeline_workers=1,
+    cache_dir=None,
+    cache_max_bytes=1 << 30,
+    cache_replay=False,
+    tokenizer="Xenova/claude-tokenizer",
+    context_token_budget=3000,
+    stream_responses=False,
+)
+if __name__ == "__main__" and "ipykernel" not in sys.modules:
+    g_main_args = MainArgs().parse_args()
+
+
+# %%
+import json
+import os
+import threading
+import time
+import traceback
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import media_processing.slideshow.markdown_slide as ms
+import media_processing.slideshow_from_markdown as sfm
+
+
+def list_articles(in_path: str) -> list[Path]:
+    """List markdown files in a directory, or the paths named in a manifest.
+
+    Manifest lines are paths relative to the manifest; blank lines and lines
+    starting with `#` are ignored.
+    """
+    path = Path(in_path)
+    if path.is_dir():
+        return sorted(path.glob("*.md"))
+
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [path.parent / line for line in lines if line and not line.startswith("#")]
+
+
+def article_out_dirs(article_paths: Sequence[Path], out_dir: Path) -> list[Path]:
+    """Give each article its own output directory.
+
+    Articles are named by their path below the deepest directory they share,
+    so a manifest listing `a/paper.md` and `b/paper.md` writes to `a/paper`
+    and `b/paper`; articles of one directory keep their plain stems.
+    """
+    resolved = [p.resolve() for p in article_paths]
+    if len(set(resolved)) < len(resolved):
+        raise ValueError("An article is listed more than once")
+    if len(resolved) == 0:
+        return []
+    base = Path(os.path.commonpath([p.parent for p in resolved]))
+    return [out_dir / p.relative_to(base).with_suffix("") for p in resolved]
+
+
+@dataclass(frozen=True)
+class ArticleResult:
+    in_path: str
+    out_path: str | None
+    slide_count: int
+    seconds: float
+    error: str | None
+
+
+def convert_article(
+    article_path: Path,
+    article_out_dir: Path,
+    example: sfm.ConversionExample,
+    config: sfm.DraftConfig,
+    pipeline_workers: int,
+) -> ArticleResult:
+    started = time.perf_counter()
+    try:
+        article = sfm.load_article(str(article_path))
+        article_out_dir.mkdir(parents=True, exist_ok=True)
+        out_path = article_out_dir / "output.md"
+        slide_count = 0
+        with open(out_path, "w", encoding="utf-8") as f:
+            writer = ms.DeckWriter(f)
+            for slide in sfm.iter_slides_from_article(
+                article, example, config, pipeline_workers
+            ):
+                writer.write(slide.slide)
+                slide_count += 1
+        return ArticleResult(
+            in_path=str(article_path),
+            out_path=str(out_path),
+            slide_count=slide_count,
+            seconds=time.perf_counter() - started,
+            error=None,
+        )
+    except Exception:
+        return ArticleResult(
+            in_path=str(article_path),
+            out_path=None,
+            slide_count=0,
+            seconds=time.perf_counter() - started,
+            error=traceback.format_exc(),
+        )
+
+
+def slideshow_batch(args: BaseArgs | MainArgs) -> list[ArticleResult]:
+    """Convert many articles in one process.
+
+    The example is parsed once and the LLM client, cache and tokenizer are
+    shared. A semaphore bounds LLM requests in flight across all articles.
+    """
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    example = sfm.load_conversion_example(
+        args.example_source_path, args.example_overview_slide_path
+    )
+    config = sfm.create_draft_config(
+        args, threading.BoundedSemaphore(args.max_concurrent_llm_calls)
+    )
+
+    article_paths = list_articles(args.in_path)
+    with ThreadPoolExecutor(max_workers=args.max_concurrent_articles) as executor:
+        results = [
+            *executor.map(
+                lambda path, article_out_dir: convert_article(
+                    path, article_out_dir, example, config, args.pipeline_workers
+                ),
+                article_paths,
+                article_out_dirs(article_paths, out_dir),
+            )
+        ]
+
+    with open(out_dir / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "articles": len(results),
+                "failed": sum(1 for r in results if r.error is not None),
+                "results": [asdict(r) for r in results],
+            },
+            f,
+            indent=2,
+        )
+    return results
+
+
+if __name__ == "__main__":
+    g_results = slideshow_batch(g_main_args)
+    g_failed = [r for r in g_results if r.error is not None]
+    print(f"Converted {len(g_results) - len(g_failed)}/{len(g_results)} articles")
+    for g_result in g_failed:
+        print(f"{g_result.in_path}:\n{g_result.error}")
@@ -0,0 +1,408 @@
+# %%
+import sys
+from dataclasses import dataclass
+
+from tap import Tap
+
+
+@dataclass(frozen=True)
+class BaseArgs:
+    section_counts: list[int]
+    llm_latency_seconds: float
+    pipeline_workers: int
+    context_token_budget: int
+    tokenizer: str | None
+    no_trace_memory: bool
+    max_growth_exponent: float
+    out_path: str | None
+
+
+class MainArgs(Tap):
+    section_counts: list[int] = [10, 100, 1000]  # Sizes of the synthetic articles
+    llm_latency_seconds: float = 0.0  # Delay of each fake LLM reply
+    pipeline_workers: int = 1  # Level-1 sections drafted concurrently (1 = serial)
+    context_token_budget: int = 3000  # Token budget for the existing slides
+    tokenizer: str | None = None  # Tokenizer file or hub id (None = 4 chars per token)
+    no_trace_memory: bool = False  # Skip the second, traced run measuring peak memory
+    max_growth_exponent: float = 1.5  # Fail if a stage grows faster than n**this
+    out_path: str | None = None  # JSON report output
+
+
+g_main_args = BaseArgs(
+    section_counts=[10, 100, 1000],
+    llm_latency_seconds=0.0,
+    pipeline_workers=1,
+    context_token_budget=3000,
+    tokenizer=None,
+    no_trace_memory=False,
+    max_growth_exponent=1.5,
+    out_path=None,
+)
+if __name__ == "__main__" and "ipykernel" not in sys.modules:
+    g_main_args = MainArgs().parse_args()
+
+
+# %%
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from dataclasses import asdict
+from functools import wraps
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+import media_processing.research_article as ra
+import media_processing.slideshow.markdown_slide as ms
+import media_processing.slideshow.slide_response as sr
+import media_processing.slideshow_from_markdown as sfm
+
+
+def fake_slide(prompt: str) -> str:
+    """Turn the last academic text quoted in `prompt` into a well-formed slide.
+
+    The reference JSON quotes the start and end of that text, so drafting
+    always advances to the next source window.
+    """
+    marker = prompt.rfind("academic text")
+    start = prompt.index('"""\n', marker) + len('"""\n')
+    source = prompt[start : prompt.index('\n"""', start)]
+    headings = [line for line in source.splitlines() if line.startswith("#")]
+    body = [
+        line for line in source.splitlines() if line.strip() and line not in headings
+    ]
+    title = headings[0].lstrip("# ") if len(headings) > 0 else "Overview"
+    first_sentence = body[0].split(". ")[0].rstrip(".") if len(body) > 0 else title
+    reference = {"start": source.strip()[:60], "end": source.strip()[-80:]}
+    return (
+        f"# {title}\n\n"
+        f"- {first_sentence}\n\n"
+        f"<!--\n{first_sentence}.\n{json.dumps(reference, ensure_ascii=False)}\n-->"
+    )
+
+
+class FakeSlideLLM(CustomLLM):
+    """Deterministic local stand-in for the slide drafting LLM."""
+
+    latency_seconds: float = 0.0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake-slide-llm")
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        time.sleep(self.latency_seconds)
+        # `get_response_content` inspects the provider's choices for errors
+        return CompletionResponse(
+            text=fake_slide(prompt), raw=SimpleNamespace(choices=[])
+        )
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        text = self.complete(prompt, formatted, **kwargs).text
+
+        def gen() -> CompletionResponseGen:
+            for i in range(0, len(text), 64):
+                yield CompletionResponse(
+                    text=text[: i + 64],
+                    delta=text[i : i + 64],
+                    raw=SimpleNamespace(choices=[]),
+                )
+
+        return gen()
+
+
+def synthetic_words(rng: random.Random, count: int) -> list[str]:
+    return [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 10)))
+        for _ in range(count)
+    ]
+
+
+def synthetic_paragraph(rng: random.Random, vocabulary: Sequence[str]) -> str:
+    sentences = [
+        " ".join(rng.choices(vocabulary, k=rng.randint(8, 16))).capitalize() + "."
+        for _ in range(rng.randint(3, 6))
+    ]
+    return " ".join(sentences)
+
+
+def synthetic_article(section_count: int, seed: int = 0) -> str:
+    """Markdown article with an abstract, an introduction and numbered chapters.
+
+    Every eighth section opens a new level-1 chapter; a reference list is
+    appended as a supportive section.
+    """
+    rng = random.Random(seed)  # noqa: S311
+    vocabulary = synthetic_words(rng, 2000)
+    blocks = [
+        f"# Abstract\n\n{synthetic_paragraph(rng, vocabulary)}",
+        f"# 1 Introduction\n\n{synthetic_paragraph(rng, vocabulary)}",
+    ]
+    chapter, subsection = 1, 0
+    for i in range(max(0, section_count - 2)):
+        if i % 8 == 0:
+            chapter, subsection = chapter + 1, 0
+            heading = f"# {chapter} Chapter {chapter}"
+        else:
+            subsection += 1
+            heading = f"## {chapter}.{subsection} Topic {chapter}.{subsection}"
+        blocks.append(f"{heading}\n\n{synthetic_paragraph(rng, vocabulary)}")
+    blocks.append(
+        "# References\n\n"
+        + "\n".join(f"{i}. {synthetic_paragraph(rng, vocabulary)}" for i in range(5))
+    )
+    return "\n\n".join(blocks) + "\n"
+
+
+class StageRecorder:
+    """Accumulates wall time, call counts and peak traced memory per stage."""
+
+    def __init__(self):
+        self.seconds: defaultdict[str, float] = defaultdict(float)
+        self.calls: Counter[str] = Counter()
+        self.peak_bytes: defaultdict[str, int] = defaultdict(int)
+        self._overall_peak_bytes = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            self._overall_peak_bytes = max(
+                self._overall_peak_bytes, tracemalloc.get_traced_memory()[1]
+            )
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - started
+            self.calls[name] += 1
+            if tracing:
+                self.peak_bytes[name] = max(
+                    self.peak_bytes[name], tracemalloc.get_traced_memory()[1] - base
+                )
+
+    def wrap[**P, R](self, name: str, function: Callable[P, R]) -> Callable[P, R]:
+        @wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with self.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    def overall_peak_bytes(self) -> int:
+        return max(self._overall_peak_bytes, tracemalloc.get_traced_memory()[1])
+
+
+@contextmanager
+def instrumented(recorder: StageRecorder) -> Iterator[None]:
+    """Time the pipeline stages by temporarily wrapping them where they live."""
+    targets: list[tuple[Any, str, str]] = [
+        (ra, "sections_from_markdown", "sections_from_markdown"),
+        (ra.ResearchArticle, "from_sections", "ResearchArticle.from_sections"),
+        (sfm, "create_next_slide_context", "create_next_slide_context"),
+        (sr.SlideResponse, "from_markdown", "SlideResponse.from_markdown"),
+    ]
+    with ExitStack() as stack:
+        for owner, name, stage in targets:
+            original = vars(owner)[name]
+            replacement = (
+                classmethod(recorder.wrap(stage, original.__func__))
+                if isinstance(original, classmethod)
+                else recorder.wrap(stage, original)
+            )
+            setattr(owner, name, replacement)
+            stack.callback(setattr, owner, name, original)
+        yield
+
+
+@dataclass(frozen=True)
+class StageResult:
+    stage: str
+    calls: int
+    seconds: float
+    peak_bytes: int | None
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    section_count: int
+    slide_count: int
+    seconds: float
+    peak_bytes: int | None
+    stages: list[StageResult]
+
+
+def run_pipeline(
+    article_path: Path,
+    config: sfm.DraftConfig,
+    pipeline_workers: int,
+    recorder: StageRecorder,
+) -> int:
+    example = sfm.ConversionExample(
+        opening_text=synthetic_article(2, seed=1), overview_slide="# Overview"
+    )
+    # Memoized parses would hide the parsing cost of a repeated run
+    ms.MarkdownSlide.from_markdown.cache_clear()
+    # The drafting loop's progress prints would dominate small timings
+    with (
+        open(os.devnull, "w") as devnull,
+        redirect_stdout(devnull),
+        instrumented(recorder),
+    ):
+        article = sfm.load_article(str(article_path))
+        slides = [
+            *sfm.iter_slides_from_article(article, example, config, pipeline_workers)
+        ]
+        with recorder.stage("render_deck"):
+            ms.render_deck(s.slide for s in slides)
+    return len(slides)
+
+
+def benchmark_article(
+    section_count: int, config: sfm.DraftConfig, args: BaseArgs | MainArgs
+) -> BenchmarkResult:
+    """Run the pipeline on one synthetic article.
+
+    Timings come from an untraced run, as tracemalloc slows allocation-heavy
+    stages several times over; peak memory comes from a second, traced run.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        article_path = Path(tmp_dir) / f"synthetic_{section_count}.md"
+        article_path.write_text(synthetic_article(section_count), encoding="utf-8")
+
+        timed = StageRecorder()
+        started = time.perf_counter()
+        slide_count = run_pipeline(article_path, config, args.pipeline_workers, timed)
+        seconds = time.perf_counter() - started
+
+        traced = None
+        if not args.no_trace_memory:
+            traced = StageRecorder()
+            tracemalloc.start()
+            try:
+                run_pipeline(article_path, config, args.pipeline_workers, traced)
+                peak_bytes = traced.overall_peak_bytes()
+            finally:
+                tracemalloc.stop()
+
+    return BenchmarkResult(
+        section_count=section_count,
+        slide_count=slide_count,
+        seconds=seconds,
+        peak_bytes=None if traced is None else peak_bytes,
+        stages=[
+            StageResult(
+                stage=stage,
+                calls=timed.calls[stage],
+                seconds=timed.seconds[stage],
+                peak_bytes=None if traced is None else traced.peak_bytes[stage],
+            )
+            for stage in timed.seconds
+        ],
+    )
+
+
+def growth_exponents(results: Sequence[BenchmarkResult]) -> dict[str, float]:
+    """Fitted exponent k of `seconds ~ sections**k` between the extreme sizes."""
+    ordered = sorted(results, key=lambda r: r.section_count)
+    smallest, largest = ordered[0], ordered[-1]
+    if largest.section_count <= smallest.section_count:
+        return {}
+    small_seconds = {s.stage: s.seconds for s in smallest.stages}
+    size_ratio = math.log(largest.section_count / smallest.section_count)
+    return {
+        s.stage: math.log(s.seconds / small_seconds[s.stage]) / size_ratio
+        for s in largest.stages
+        if small_seconds.get(s.stage, 0) > 0 and s.seconds > 0
+    }
+
+
+def format_report(
+    results: Sequence[BenchmarkResult], exponents: dict[str, float]
+) -> str:
+    lines = []
+    for result in results:
+        peak = (
+            "" if result.peak_bytes is None else f", peak {result.peak_bytes >> 10} KiB"
+        )
+        lines.append(
+            f"{result.section_count} sections, {result.slide_count} slides:"
+            f" {result.seconds:.3f} s{peak}"
+        )
+        for s in result.stages:
+            stage_peak = "" if s.peak_bytes is None else f"{s.peak_bytes >> 10:>10} KiB"
+            lines.append(
+                f"  {s.stage:<40}{s.calls:>6} calls{s.seconds * 1000:>12.2f} ms"
+                f"{stage_peak}"
+            )
+    if len(exponents) > 0:
+        lines.append("growth exponent (seconds ~ sections**k):")
+        lines += [f"  {stage:<40}{k:>6.2f}" for stage, k in exponents.items()]
+    return "\n".join(lines)
+
+
+def slideshow_benchmark(
+    args: BaseArgs | MainArgs,
+) -> tuple[list[BenchmarkResult], dict[str, float]]:
+    config = sfm.DraftConfig(
+        llm=FakeSlideLLM(latency_seconds=args.llm_latency_seconds),
+        system_prompt=sfm.system_prompt,
+        cache=None,
+        count_tokens=(
+            (lambda text: len(text) // 4)
+            if args.tokenizer is None
+            else sfm.load_token_counter(args.tokenizer)
+        ),
+        context_token_budget=args.context_token_budget,
+    )
+    results = [
+        benchmark_article(section_count, config, args)
+        for section_count in args.section_counts
+    ]
+    return results, growth_exponents(results)
+
+
+if __name__ == "__main__":
+    g_results, g_exponents = slideshow_benchmark(g_main_args)
+    print(format_report(g_results, g_exponents))
+    if g_main_args.out_path is not None:
+        with open(g_main_args.out_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "results": [asdict(r) for r in g_results],
+                    "growth_exponents": g_exponents,
+                },
+                f,
+                indent=2,
+            )
+    g_regressions = {
+        stage: k
+        for stage, k in g_exponents.items()
+        if k > g_main_args.max_growth_exponent
+    }
+    if len(g_regressions) > 0:
+        print(f"Stages growing faster than allowed: {g_regressions}")
+        sys.exit(1)
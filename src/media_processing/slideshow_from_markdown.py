@@ -11,6 +11,16 @@ class BaseArgs:
     out_dir: str
     example_source_path: str
     example_overview_slide_path: str
+    pipeline_workers: int
+    cache_dir: str | None
+    cache_max_bytes: int
+    cache_replay: bool
+    tokenizer: str
+    context_token_budget: int
+    stream_responses: bool
+    metrics_path: str | None
+    checkpoint_path: str | None
+    resume: bool
 
 
 class MainArgs(Tap):
@@ -18,6 +28,16 @@ class MainArgs(Tap):
     out_dir: str  # Directory for output files
     example_source_path: str  # Path to example source text
     example_overview_slide_path: str  # Path to example slide format
+    pipeline_workers: int = 1  # Level-1 sections drafted concurrently (1 = serial)
+    cache_dir: str | None = None  # Directory for the LLM response cache
+    cache_max_bytes: int = 1 << 30  # Size limit of the LLM response cache
+    cache_replay: bool = False  # Only serve cached responses, never call the LLM
+    tokenizer: str = "Xenova/claude-tokenizer"  # Tokenizer file or hub id
+    context_token_budget: int = 3000  # Token budget for the existing slides
+    stream_responses: bool = False  # Stream replies and stop after the reference JSON
+    metrics_path: str | None = None  # LLM metrics output (.prom or .jsonl)
+    checkpoint_path: str | None = None  # File to save loop state to after each slide
+    resume: bool = False  # Continue from the state saved at checkpoint_path
 
 
 g_main_args = BaseArgs(
@@ -26,22 +46,37 @@ g_main_args = BaseArgs(
     example_source_path="../../test/fixture/scientific_article_markdown_1.md",
     example_overview_slide_path="../../test/fixture/markdown_to_slideshow/scientific_article_1_overview_slide.md",
     out_dir="../../test/output",
+    pipeline_workers=1,
+    cache_dir=None,
+    cache_max_bytes=1 << 30,
+    cache_replay=False,
+    tokenizer="Xenova/claude-tokenizer",
+    context_token_budget=3000,
+    stream_responses=False,
+    metrics_path=None,
+    checkpoint_path=None,
+    resume=False,
 )
 if __name__ == "__main__" and "ipykernel" not in sys.modules:
     g_main_args = MainArgs().parse_args()
 
 
+import json
 import os
-from collections.abc import Iterable, Sequence
+import queue
+import threading
+from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from itertools import pairwise
 from pathlib import Path
-from typing import Any, cast
+from typing import Any, Self, cast
 
 import stamina
-from llama_index.core import SimpleDirectoryReader
 from llama_index.core.llms import LLM, ChatMessage, ChatResponse, MessageRole
-from llama_index.core.node_parser import MarkdownNodeParser
-from llama_index.llms.openrouter import OpenRouter
 
+import media_processing.disk_cache as dc
 import media_processing.research_article as ra
 import media_processing.slideshow.markdown_slide as ms
 import media_processing.slideshow.slide_response as sr
@@ -57,10 +92,14 @@ def source_context_prompt(text: str) -> str:
     return f"I have the following academic text:\n{triple_quote(text)}"
 
 
-def get_response_content(res: ChatResponse):
+def raise_choice_errors(res: ChatResponse):
     for choice in cast(Any, res.raw).choices:
         if hasattr(choice, "error"):
             raise ValueError(choice.error)
+
+
+def get_response_content(res: ChatResponse):
+    raise_choice_errors(res)
     if res.message.content is None:
         raise ValueError("respond message is None")
     return res.message.content
@@ -86,14 +125,6 @@ def overview_request_prompt(example_text: str, example_slide: str, text: str) ->
     )
 
 
-def expand_slice(s: slice, length: int) -> range:
-    return range(length)[s]
-
-
-def merge_slice_ranges(slices: Iterable[slice], length: int) -> list[int]:
-    return [*dict.fromkeys(i for s in slices for i in expand_slice(s, length))]
-
-
 @dataclass(frozen=True)
 class ContentSlide:
     slide: ms.MarkdownSlide
@@ -104,34 +135,113 @@ class NonContentSlide:
     slide: ms.MarkdownSlide
 
 
-def condense_existing_slides(
-    existing_slides: Sequence[ContentSlide | NonContentSlide],
-) -> Sequence[ms.MarkdownSlide]:
-    content_slide_indices = [
-        i for i, s in enumerate(existing_slides) if isinstance(s, ContentSlide)
-    ]
-    preserved_indices = [
-        content_slide_indices[i]
-        for i in merge_slice_ranges(
-            [slice(0, 3), slice(-3, None)], len(content_slide_indices)
-        )
-    ]
-    return [
-        (
-            s.slide
-            if i in preserved_indices or not isinstance(s, ContentSlide)
-            else ms.MarkdownSlide.from_markdown(
-                f"# {ms.MarkdownSlide.render_tokens(s.slide.title.node.to_tokens())}\n\n\\[...\\]"
-            )
+TokenCounter = Callable[[str], int]
+
+
+def load_token_counter(tokenizer: str) -> TokenCounter:
+    """Load a tokenizer file, or the `tokenizer.json` of a hub repository.
+
+    Hub files come through the local Hugging Face cache, which is used
+    without the network when it is unreachable or `HF_HUB_OFFLINE=1` is set,
+    so offline runs such as `--cache_replay` count tokens as before.
+    """
+    from tokenizers import Tokenizer
+
+    if Path(tokenizer).is_file():
+        loaded = Tokenizer.from_file(tokenizer)
+    else:
+        from huggingface_hub import hf_hub_download
+
+        loaded = Tokenizer.from_file(hf_hub_download(tokenizer, "tokenizer.json"))
+    return lambda text: len(loaded.encode(text, add_special_tokens=False).ids)
+
+
+@dataclass(frozen=True)
+class RenderedSlide:
+    markdown: str
+    tokens: int
+    condensed_markdown: str
+    condensed_tokens: int
+
+
+class SlideContextBuilder:
+    """Builds the existing-slides prompt within a token budget.
+
+    Each slide is rendered and counted once, in full and condensed to its
+    title. Slides are taken in their condensed form, starting with the
+    overview slide and then walking back from the newest slide, until the
+    budget is used up; older slides are left out. The remaining budget
+    upgrades the taken content slides to their full form in the same order.
+    Slides must only ever be appended to the sequence passed to `prompt`.
+    """
+
+    def __init__(self, count_tokens: TokenCounter, token_budget: int):
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self._rendered: list[RenderedSlide] = []
+
+    def _render(self, slide: ContentSlide | NonContentSlide) -> RenderedSlide:
+        markdown = slide.slide.to_markdown()
+        tokens = self.count_tokens(markdown)
+        if not isinstance(slide, ContentSlide):
+            return RenderedSlide(markdown, tokens, markdown, tokens)
+
+        title = ms.MarkdownSlide.render_tokens(slide.slide.title.node.to_tokens())
+        condensed = ms.MarkdownSlide.from_markdown(
+            f"{title.rstrip()}\n\n\\[...\\]"
+        ).to_markdown()
+        return RenderedSlide(markdown, tokens, condensed, self.count_tokens(condensed))
+
+    def select(
+        self, existing_slides: Sequence[ContentSlide | NonContentSlide]
+    ) -> list[str]:
+        self._rendered += [
+            self._render(s) for s in existing_slides[len(self._rendered) :]
+        ]
+        rendered = self._rendered[: len(existing_slides)]
+
+        overview_index = next(
+            (i for i, s in enumerate(existing_slides) if isinstance(s, ContentSlide)),
+            None,
         )
-        for i, s in enumerate(existing_slides)
-    ]
+        priority = [
+            *([] if overview_index is None else [overview_index]),
+            *(i for i in reversed(range(len(rendered))) if i != overview_index),
+        ]
+        remaining = self.token_budget
+        taken: list[int] = []
+        for i in priority:
+            if rendered[i].condensed_tokens > remaining:
+                break
+            remaining -= rendered[i].condensed_tokens
+            taken.append(i)
+
+        full_indices: set[int] = set()
+        for i in taken:
+            if not isinstance(existing_slides[i], ContentSlide):
+                continue
+            extra = rendered[i].tokens - rendered[i].condensed_tokens
+            if extra > remaining:
+                break
+            remaining -= extra
+            full_indices.add(i)
+
+        return [
+            rendered[i].markdown
+            if i in full_indices
+            else rendered[i].condensed_markdown
+            for i in sorted(taken)
+        ]
+
+    def prompt(self, existing_slides: Sequence[ContentSlide | NonContentSlide]) -> str:
+        return ms.rendered_slides_to_context_prompt(self.select(existing_slides))
 
 
 def create_next_slide_context(
     prior_chat_context: Iterable[ChatMessage],
     existing_slides: Sequence[ContentSlide | NonContentSlide],
     source: str,
+    context_builder: SlideContextBuilder,
 ) -> list[ChatMessage]:
     source_context = source_context_prompt(source)
     next_slide_prompt = """Write the single next slide. The slide content should be brief. The speaker notes should reference the slide content, not the slide itself, without adding introductory or concluding remarks. At the end of the speaker notes, before closing the bracket, write down:
@@ -142,14 +252,16 @@ def create_next_slide_context(
 }
 Stop the output after closing the speaker notes.  
 Following the text in chronological order. Do not skip any part."""
-    condensed_slides_prompt = ms.slides_to_context_prompt(
-        condense_existing_slides(existing_slides)
-    )
     chat_context = [
         *prior_chat_context,
         ChatMessage(role=MessageRole.USER, content=source_context),
         *(
-            [ChatMessage(role=MessageRole.USER, content=condensed_slides_prompt)]
+            [
+                ChatMessage(
+                    role=MessageRole.USER,
+                    content=context_builder.prompt(existing_slides),
+                )
+            ]
             if len(existing_slides) > 0
             else []
         ),
@@ -159,90 +271,468 @@ Following the text in chronological order. Do not skip any part."""
     return chat_context
 
 
+reference_request_prompt = """Your slide's speaker notes are missing the referenced range. Reply with only the JSON object for it, in this format:
+{
+    "start": "Start of a sentence...",
+    "end": "...end of a sentence."
+}"""
+
+notes_request_prompt = "Your slide has no speaker notes. Reply with only the speaker notes as an HTML comment, ending with the JSON object of the referenced range as requested."
+
+
+def slide_repair_prompt(error: ValueError) -> str:
+    return f"Your slide could not be parsed ({error}). Reply with only the corrected slide in the requested format, nothing else."
+
+
+def follow_up_context(
+    chat_context: Sequence[ChatMessage], reply: str, request: str
+) -> list[ChatMessage]:
+    return [
+        *chat_context,
+        ChatMessage(role=MessageRole.ASSISTANT, content=reply),
+        ChatMessage(role=MessageRole.USER, content=request),
+    ]
+
+
+@stamina.retry(on=ValueError, attempts=3)
+def chat_with_retry(llm: LLM, messages: Sequence[ChatMessage]):
+    return get_response_content(llm.chat(messages))
+
+
+@stamina.retry(on=ValueError, attempts=3)
+def stream_chat_with_retry(llm: LLM, messages: Sequence[ChatMessage]) -> str:
+    """Stream a reply and cut it off once it holds a complete slide response.
+
+    Closing the stream drops the connection, so the provider stops generating
+    the text models tend to add after the speaker notes.
+    """
+    content = ""
+    stream = llm.stream_chat(messages)
+    try:
+        for res in stream:
+            raise_choice_errors(res)
+            # Back up so a "-->" split across two deltas is still found
+            search_from = max(0, len(content) - 2)
+            content = res.message.content or ""
+            end = sr.find_response_end(content, search_from)
+            if end is not None:
+                return content[:end]
+    finally:
+        stream.close()
+    if content == "":
+        raise ValueError("respond message is empty")
+    return content
+
+
+def chat_cache_key(llm: LLM, messages: Sequence[ChatMessage]) -> str:
+    return dc.hash_key(
+        {
+            "model": llm.metadata.model_name,
+            "params": {
+                name: getattr(llm, name, None)
+                for name in ("temperature", "max_tokens", "additional_kwargs")
+            },
+            "messages": [m.model_dump(mode="json") for m in messages],
+        }
+    )
+
+
+def limited_chat(
+    llm: LLM,
+    messages: Sequence[ChatMessage],
+    llm_slots: threading.Semaphore | None = None,
+    stream: bool = False,
+) -> str:
+    with llm_slots or nullcontext():
+        if stream:
+            return stream_chat_with_retry(llm, messages)
+        return chat_with_retry(llm, messages)
+
+
+def cached_chat(
+    llm: LLM,
+    messages: Sequence[ChatMessage],
+    cache: dc.DiskCache | None,
+    llm_slots: threading.Semaphore | None = None,
+    stream: bool = False,
+    pending: dict[str, bytes] | None = None,
+) -> str:
+    """Chat through `cache`, storing new replies unless `pending` is given.
+
+    With `pending`, new replies are collected there instead, for the caller
+    to store once it accepts them.
+    """
+    if cache is None:
+        return limited_chat(llm, messages, llm_slots, stream)
+
+    key = chat_cache_key(llm, messages)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode()
+    if cache.read_only:
+        raise dc.CacheMissError(f"No cached LLM response for key {key}")
+
+    content = limited_chat(llm, messages, llm_slots, stream)
+    if pending is None:
+        cache.put(key, content.encode())
+    else:
+        pending[key] = content.encode()
+    return content
+
+
+def plan_level1_runs(article: ra.ResearchArticle, start: int) -> list[range]:
+    boundaries = [
+        start,
+        *(i for i in article.primary_level1_indices if i > start),
+        len(article.primary_sections),
+    ]
+    return [range(a, b) for a, b in pairwise(boundaries) if a < b]
+
+
+@dataclass(frozen=True)
+class DraftConfig:
+    llm: LLM
+    system_prompt: ChatMessage
+    cache: dc.DiskCache | None
+    count_tokens: TokenCounter
+    context_token_budget: int
+    # Shared across articles in batch runs to bound in-flight LLM requests
+    llm_slots: threading.Semaphore | None = None
+    stream: bool = False
+
+    def chat(
+        self,
+        messages: Sequence[ChatMessage],
+        pending: dict[str, bytes] | None = None,
+    ) -> str:
+        return cached_chat(
+            self.llm, messages, self.cache, self.llm_slots, self.stream, pending
+        )
+
+    def chat_slide(
+        self, messages: Sequence[ChatMessage], require_reference: bool = True
+    ) -> sr.SlideResponse:
+        """Chat for one slide, repairing a malformed reply instead of resending.
+
+        Formatting slips are fixed locally. An unparseable slide or a missing
+        reference costs one short follow-up asking only for what is wrong;
+        provider errors are still retried by `chat_with_retry`. Replies are
+        only cached once the slide is accepted, so a rerun asks again instead
+        of replaying a reply that could not be repaired.
+        """
+        pending: dict[str, bytes] = {}
+        response = self._chat_slide(
+            partial(self.chat, pending=pending), messages, require_reference
+        )
+        if self.cache is not None:
+            for key, content in pending.items():
+                self.cache.put(key, content)
+        return response
+
+    @staticmethod
+    def _chat_slide(
+        chat: Callable[[Sequence[ChatMessage]], str],
+        messages: Sequence[ChatMessage],
+        require_reference: bool,
+    ) -> sr.SlideResponse:
+        content = chat(messages)
+        response: sr.SlideResponse | None = None
+        try:
+            response = sr.SlideResponse.from_repaired_markdown(content)
+        except sr.MissingReferenceError:
+            pass
+        except ValueError as error:
+            content = chat(
+                follow_up_context(messages, content, slide_repair_prompt(error))
+            )
+            try:
+                response = sr.SlideResponse.from_repaired_markdown(content)
+            except sr.MissingReferenceError:
+                pass
+
+        if response is not None and (
+            response.reference_status is not None or not require_reference
+        ):
+            return response
+        follow_up = chat(
+            follow_up_context(
+                messages,
+                content,
+                reference_request_prompt if response is None else notes_request_prompt,
+            )
+        )
+        return sr.SlideResponse.from_repaired_markdown(
+            sr.with_reference(
+                content if response is None else response.slide.markdown, follow_up
+            )
+        )
+
+
+def slide_to_json(slide: ContentSlide | NonContentSlide) -> dict[str, str]:
+    return {
+        "kind": "content" if isinstance(slide, ContentSlide) else "non_content",
+        "markdown": slide.slide.to_markdown(),
+    }
+
+
+def slide_from_json(data: dict[str, str]) -> ContentSlide | NonContentSlide:
+    slide = ms.MarkdownSlide.from_markdown(data["markdown"])
+    return ContentSlide(slide) if data["kind"] == "content" else NonContentSlide(slide)
+
+
 @dataclass
-class TextRange:
-    start: int
-    end: int
-    text: str
-
-
-class SourceTracker:
-    def __init__(self):
-        self.sections: list[ra.Section] = []
-        self.referenced_ranges: list[TextRange] = []
-        self._cached_text: str | None = None
-
-    @property
-    def source_text(self) -> str:
-        if self._cached_text is None:
-            self._cached_text = ra.markdown_from_sections(self.sections)
-        return self._cached_text
-
-    def update_sections(self, removed_count: int, new_sections: Sequence[ra.Section]):
-        if removed_count > len(self.sections):
-            raise ValueError("Cannot remove more sections than exist")
-
-        removed_text_length = len(
-            ra.markdown_from_sections(self.sections[:removed_count])
+class DraftState:
+    slides: list[ContentSlide | NonContentSlide]
+    next_section_index: int
+    old_source_start: int
+    last_level1_title: str | None
+    done: bool = False
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "slides": [slide_to_json(s) for s in self.slides],
+            "next_section_index": self.next_section_index,
+            "old_source_start": self.old_source_start,
+            "last_level1_title": self.last_level1_title,
+            "done": self.done,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            slides=[slide_from_json(s) for s in data["slides"]],
+            next_section_index=data["next_section_index"],
+            old_source_start=data["old_source_start"],
+            last_level1_title=data["last_level1_title"],
+            done=data["done"],
         )
 
-        self.referenced_ranges = [
-            TextRange(
-                r.start - removed_text_length, r.end - removed_text_length, r.text
+
+class Checkpoint:
+    """Loop state of a slideshow run, rewritten atomically after every slide.
+
+    States are keyed by section range, so serial and pipelined runs each
+    resume from their own entries.
+    """
+
+    def __init__(self, path: str | Path, article_key: str, resume: bool):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: dict[str, Any] = {"article": article_key, "runs": {}}
+        if resume and self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("article") != article_key:
+                raise ValueError(f"Checkpoint {self.path} is for a different article")
+            self._data = data
+
+    def overview(self) -> ContentSlide | None:
+        data = self._data.get("overview")
+        return None if data is None else ContentSlide(slide_from_json(data).slide)
+
+    def save_overview(self, slide: ContentSlide):
+        with self._lock:
+            self._data["overview"] = slide_to_json(slide)
+            self._write()
+
+    def run_state(self, section_range: range) -> DraftState | None:
+        data = self._data["runs"].get(f"{section_range.start}-{section_range.stop}")
+        return None if data is None else DraftState.from_json(data)
+
+    def save_run_state(self, section_range: range, state: DraftState):
+        with self._lock:
+            self._data["runs"][f"{section_range.start}-{section_range.stop}"] = (
+                state.to_json()
             )
-            for r in self.referenced_ranges
-            if r.start >= removed_text_length
-        ]
+            self._write()
 
-        self.sections = self.sections[removed_count:] + list(new_sections)
-        self._cached_text = None
+    def _write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        tmp_path.write_text(
+            json.dumps(self._data, separators=(",", ":")), encoding="utf-8"
+        )
+        tmp_path.replace(self.path)
 
-    def add_reference(self, text: str):
-        start = self.source_text.find(text)
-        if start >= 0:
-            self.referenced_ranges.append(TextRange(start, start + len(text), text))
-            self._merge_overlapping_ranges()
 
-    def _merge_overlapping_ranges(self):
-        if not self.referenced_ranges:
-            return
+def level1_divider(title: str | None) -> NonContentSlide:
+    return NonContentSlide(
+        slide=ms.MarkdownSlide.from_markdown(f"---\nlayout: center\n---\n\n# {title}")
+    )
 
-        self.referenced_ranges.sort(key=lambda r: r.start)
-        merged = [self.referenced_ranges[0]]
 
-        for current in self.referenced_ranges[1:]:
-            previous = merged[-1]
-            if current.start <= previous.end:
-                previous.end = max(previous.end, current.end)
-                previous.text = self.source_text[previous.start : previous.end]
-            else:
-                merged.append(current)
+def planned_level1_dividers(
+    article: ra.ResearchArticle, section_range: range
+) -> list[NonContentSlide]:
+    """The dividers drafting `section_range` creates, known before drafting."""
+    titles = [
+        article.primary_sections[i].title
+        for i in article.primary_level1_indices
+        if i in section_range
+    ]
+    return [
+        level1_divider(title)
+        for i, title in enumerate(titles)
+        if i == 0 or title != titles[i - 1]
+    ]
 
-        self.referenced_ranges = merged
 
-    def get_marked_source(self) -> str:
-        if len(self.referenced_ranges) == 0:
-            return self.source_text
+def iter_draft_slides(
+    config: DraftConfig,
+    article: ra.ResearchArticle,
+    section_range: range,
+    prior_slides: Sequence[ContentSlide | NonContentSlide],
+    checkpoint: Checkpoint | None = None,
+    source_start: int | None = None,
+) -> Iterator[ContentSlide | NonContentSlide]:
+    """Draft slides for the primary sections in `section_range`.
+
+    Only the newly created slides are yielded, each as soon as it is accepted.
+    The first source offered to the model starts at `source_start`, which
+    defaults to the start of the range; an earlier section carries over text
+    the previous slides may not have covered. With a checkpoint, slides saved
+    for this range are yielded first and drafting resumes after them.
+    """
+    state = None if checkpoint is None else checkpoint.run_state(section_range)
+    if state is None:
+        state = DraftState(
+            slides=[],
+            next_section_index=section_range.start,
+            old_source_start=(
+                section_range.start if source_start is None else source_start
+            ),
+            last_level1_title=None,
+        )
+    yield from [*state.slides]
+    if state.done:
+        return
+
+    new_source_window = article.window_until_threshold(
+        state.next_section_index, 2000, 750
+    )
+    context_builder = SlideContextBuilder(
+        config.count_tokens, config.context_token_budget
+    )
+    while state.next_section_index < section_range.stop:
+        print(state.next_section_index)
+        for section in article.primary_sections[
+            new_source_window.start : new_source_window.stop
+        ]:
+            if section.level == 1 and state.last_level1_title != section.title:
+                state.last_level1_title = section.title
+                divider = level1_divider(section.title)
+                state.slides.append(divider)
+                yield divider
+        next_slide_context: Sequence[ChatMessage] = create_next_slide_context(
+            prior_chat_context=[config.system_prompt],
+            existing_slides=[*prior_slides, *state.slides],
+            source=article.primary_markdown(
+                range(state.old_source_start, new_source_window.stop)
+            ),
+            context_builder=context_builder,
+        )
+        next_slide = config.chat_slide(next_slide_context)
 
-        result = []
-        last_end = 0
+        content_slide = ContentSlide(slide=next_slide.slide)
+        state.slides.append(content_slide)
+        yield content_slide
 
-        for r in self.referenced_ranges:
-            result.append(self.source_text[last_end : r.start])
-            result.append(f"<referenced>{r.text}</referenced>")
-            last_end = r.end
+        print("slide_title:", next_slide.slide.title.to_segments())
+        print("slide_status:", next_slide.reference_status)
 
-        result.append(self.source_text[last_end:])
-        return "".join(result)
+        if next_slide.reference_status is None:
+            raise ValueError("LLM did not respond with reference status Json")
+        aligner = article.primary_aligner(new_source_window)
+        end_match = aligner.locate(
+            next_slide.reference_status.end.strip(".")[-300:],
+            search_from=max(0, len(aligner.text) - 1000),
+        )
 
+        if end_match is not None:
+            print("reference end found, score:", end_match.score)
+            state.old_source_start = end_match.section_index
 
-@stamina.retry(on=ValueError, attempts=3)
-def chat_with_retry(llm: LLM, messages: Sequence[ChatMessage]):
-    return get_response_content(llm.chat(messages))
+            state.next_section_index = new_source_window.stop
+            new_source_window = article.window_until_threshold(
+                state.next_section_index, 2000, 750
+            )
 
+        if checkpoint is not None:
+            checkpoint.save_run_state(section_range, state)
+
+    state.done = True
+    if checkpoint is not None:
+        checkpoint.save_run_state(section_range, state)
+
+
+def draft_slides(
+    config: DraftConfig,
+    article: ra.ResearchArticle,
+    section_range: range,
+    prior_slides: Sequence[ContentSlide | NonContentSlide],
+    checkpoint: Checkpoint | None = None,
+) -> list[ContentSlide | NonContentSlide]:
+    return [
+        *iter_draft_slides(config, article, section_range, prior_slides, checkpoint)
+    ]
+
+
+def iter_in_order[T](
+    producers: Sequence[Callable[[], Iterable[T]]], max_workers: int
+) -> Iterator[T]:
+    """Run producers concurrently, yielding their items in producer order.
+
+    Items of the first unfinished producer are yielded as they arrive; later
+    producers are buffered until every earlier one is exhausted. If a
+    producer raises or the consumer stops early, producers that have not
+    started are cancelled and running ones stop before their next item.
+    """
+    queues: list[queue.Queue[tuple[bool, Any]]] = [queue.Queue() for _ in producers]
+    stop = threading.Event()
+
+    def run(producer: Callable[[], Iterable[T]], items: queue.Queue):
+        iterator = None
+        try:
+            if stop.is_set():
+                return
+            iterator = iter(producer())
+            for item in iterator:
+                items.put((False, item))
+                if stop.is_set():
+                    return
+        except BaseException as e:
+            items.put((True, e))
+        else:
+            items.put((True, None))
+        finally:
+            if isinstance(iterator, Generator):
+                iterator.close()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for producer, items in zip(producers, queues, strict=True):
+            executor.submit(run, producer, items)
+        for items in queues:
+            while True:
+                finished, value = items.get()
+                if finished and value is not None:
+                    raise value
+                if finished:
+                    break
+                yield value
+    finally:
+        stop.set()
+        executor.shutdown(cancel_futures=True)
+
+
+system_prompt = ChatMessage(
+    role=MessageRole.SYSTEM,
+    content="Write the next reply in the conversation. Use markdown for formatting when appropriate. Be concise yet helpful. Offer direct answers when possible. Ask questions if needed. Explain complex concepts with brief examples. Avoid repetition and strive to add value with each response.",
+)
+
+
+def create_llm(api_key: str) -> LLM:
+    from llama_index.llms.openrouter import OpenRouter
 
-def slideshow_from_markdown(args: BaseArgs | MainArgs) -> str:
-    api_key = os.environ["OPENROUTER_API_KEY"]
     # llm_smart = OpenRouter(
     #     max_tokens=1920,
     #     context_window=16384,
@@ -253,7 +743,7 @@ def slideshow_from_markdown(args: BaseArgs | MainArgs) -> str:
     #     temperature=0.08,
     # )
 
-    llm_smartest = OpenRouter(
+    return OpenRouter(
         max_tokens=1920,
         context_window=16384,
         model="anthropic/claude-3.5-sonnet",
@@ -268,126 +758,185 @@ def slideshow_from_markdown(args: BaseArgs | MainArgs) -> str:
         },
     )
 
-    article = ra.ResearchArticle.from_sections(
-        ra.sections_from_nodes(
-            MarkdownNodeParser().get_nodes_from_documents(
-                SimpleDirectoryReader(input_files=[args.in_path]).load_data()
-            )
-        )
+
+def load_article(path: str) -> ra.ResearchArticle:
+    return ra.ResearchArticle.from_sections(
+        ra.sections_from_markdown(ra.read_markdown(path))
     )
-    example_article = ra.ResearchArticle.from_sections(
-        ra.sections_from_nodes(
-            MarkdownNodeParser().get_nodes_from_documents(
-                SimpleDirectoryReader(
-                    input_files=[args.example_source_path]
-                ).load_data()
-            )
-        )
+
+
+@dataclass(frozen=True)
+class ConversionExample:
+    opening_text: str
+    overview_slide: str
+
+
+def load_conversion_example(
+    source_path: str, overview_slide_path: str
+) -> ConversionExample:
+    with open(overview_slide_path, encoding="utf-8") as f:
+        overview_slide = f.read()
+    return ConversionExample(
+        opening_text=ra.markdown_from_sections(
+            load_article(source_path).get_primary_opening_sections()
+        ),
+        overview_slide=overview_slide,
     )
-    with open(args.example_overview_slide_path, encoding="utf-8") as f:
-        example_slide = f.read()
 
-    system_prompt = ChatMessage(
-        role=MessageRole.SYSTEM,
-        content="Write the next reply in the conversation. Use markdown for formatting when appropriate. Be concise yet helpful. Offer direct answers when possible. Ask questions if needed. Explain complex concepts with brief examples. Avoid repetition and strive to add value with each response.",
+
+def create_draft_config(
+    args: BaseArgs | MainArgs, llm_slots: threading.Semaphore | None = None
+) -> DraftConfig:
+    # Replays never call the LLM, which then only provides the cache keys
+    api_key = (
+        os.environ.get("OPENROUTER_API_KEY", "cache-replay")
+        if args.cache_replay and args.cache_dir is not None
+        else os.environ["OPENROUTER_API_KEY"]
     )
-    opening_sections = article.get_primary_opening_sections()
+    return DraftConfig(
+        llm=create_llm(api_key),
+        system_prompt=system_prompt,
+        cache=(
+            None
+            if args.cache_dir is None
+            else dc.DiskCache(
+                args.cache_dir, args.cache_max_bytes, read_only=args.cache_replay
+            )
+        ),
+        count_tokens=load_token_counter(args.tokenizer),
+        context_token_budget=args.context_token_budget,
+        llm_slots=llm_slots,
+        stream=args.stream_responses,
+    )
+
+
+def iter_slides_from_article(
+    article: ra.ResearchArticle,
+    example: ConversionExample,
+    config: DraftConfig,
+    pipeline_workers: int,
+    checkpoint: Checkpoint | None = None,
+) -> Iterator[ContentSlide | NonContentSlide]:
     overview_request = ChatMessage(
         role=MessageRole.USER,
         content=overview_request_prompt(
-            ra.markdown_from_sections(example_article.get_primary_opening_sections()),
-            example_slide,
-            ra.markdown_from_sections(opening_sections),
+            example.opening_text,
+            example.overview_slide,
+            ra.markdown_from_sections(article.get_primary_opening_sections()),
         ),
     )
 
-    overview_slide_response = sr.SlideResponse.from_markdown(
-        chat_with_retry(llm_smartest, [system_prompt, overview_request])
-    )
-
-    next_section_index = next(
-        i
-        for i, s in enumerate(article.primary_sections)
-        if s.matches_type(ra.CommonPrimarySectionType.INTRODUCTION)
-    )
-    old_source_sections: Sequence[ra.Section] = []
-    new_source_sections: Sequence[ra.Section] = ra.get_sections_until_threshold(
-        article.primary_sections[next_section_index:], 2000, 750
-    )
-    existing_slides: list[ContentSlide | NonContentSlide] = [
-        ContentSlide(slide=overview_slide_response.slide)
-    ]
-    last_level1_title: str | None = None
-    while next_section_index < len(article.primary_sections):
-        print(next_section_index)
-        for section in new_source_sections:
-            if section.level == 1 and last_level1_title != section.title:
-                last_level1_title = section.title
-                existing_slides.append(
-                    NonContentSlide(
-                        slide=ms.MarkdownSlide.from_markdown(
-                            f"---\nlayout: center\n---\n\n# {section.title}"
-                        )
-                    )
+    overview_slide = None if checkpoint is None else checkpoint.overview()
+    if overview_slide is None:
+        overview_slide = ContentSlide(
+            slide=config.chat_slide(
+                [config.system_prompt, overview_request], require_reference=False
+            ).slide
+        )
+        if checkpoint is not None:
+            checkpoint.save_overview(overview_slide)
+    yield overview_slide
+
+    intro_index = article.first_index_of_type(ra.CommonPrimarySectionType.INTRODUCTION)
+    if intro_index is None:
+        raise ValueError("Article has no introduction section")
+    overview_slides = [overview_slide]
+    if pipeline_workers > 1:
+        # A run cannot wait for the slides of earlier runs, so it sees their
+        # planned dividers instead, and starts its source at the previous
+        # run's last section, as the serial loop would unless the last slide
+        # of that run ended further back. Decks can differ from serial ones.
+        yield from iter_in_order(
+            [
+                partial(
+                    iter_draft_slides,
+                    config,
+                    article,
+                    run,
+                    [
+                        *overview_slides,
+                        *planned_level1_dividers(
+                            article, range(intro_index, run.start)
+                        ),
+                    ],
+                    checkpoint,
+                    source_start=max(intro_index, run.start - 1),
                 )
-        next_slide_context: Sequence[ChatMessage] = create_next_slide_context(
-            prior_chat_context=[system_prompt],
-            existing_slides=existing_slides,
-            source=ra.markdown_from_sections(old_source_sections + new_source_sections),
+                for run in plan_level1_runs(article, intro_index)
+            ],
+            pipeline_workers,
         )
-        next_slide = sr.SlideResponse.from_markdown(
-            chat_with_retry(llm_smartest, next_slide_context)
+    else:
+        yield from iter_draft_slides(
+            config,
+            article,
+            range(intro_index, len(article.primary_sections)),
+            overview_slides,
+            checkpoint,
         )
 
-        existing_slides.append(ContentSlide(slide=next_slide.slide))
-
-        print("slide_title:", next_slide.slide.title.to_segments())
-        print("slide_status:", next_slide.reference_status)
-
-        if next_slide.reference_status is None:
-            raise ValueError("LLM did not respond with reference status Json")
-        source_end_text = ra.markdown_from_sections(new_source_sections)[-1000:]
-        stripped_end_status = next_slide.reference_status.end.strip(".")[-300:]
-        # if stripped_end_status not in source_end_text:
-        #     print(f"{stripped_end_status} not in  {source_end_text}]")
-
-        if stripped_end_status in source_end_text:
-            print("stripped_end_status in source_end_text")
-            matching_section_index = next(
-                (
-                    i
-                    for i, section in enumerate(new_source_sections)
-                    if stripped_end_status in ra.markdown_from_sections([section])
-                )
-            )
 
-            old_source_sections = new_source_sections[matching_section_index:]
+def slides_from_article(
+    article: ra.ResearchArticle,
+    example: ConversionExample,
+    config: DraftConfig,
+    pipeline_workers: int,
+    checkpoint: Checkpoint | None = None,
+) -> list[ContentSlide | NonContentSlide]:
+    return [
+        *iter_slides_from_article(
+            article, example, config, pipeline_workers, checkpoint
+        )
+    ]
 
-            next_section_index += len(new_source_sections)
-            new_source_sections = ra.get_sections_until_threshold(
-                article.primary_sections[next_section_index:], 2000, 750
-            )
 
-    return ms.MarkdownSlide.render_tokens(
-        [
-            token
-            for s in existing_slides
-            for slide_tokens in [s.slide.to_tokens()]
-            for token in (
-                ms.MarkdownSlide.parser.parse("---") + slide_tokens
-                if s.slide.front_matter is None
-                else slide_tokens
+def iter_slideshow_from_markdown(
+    args: BaseArgs | MainArgs,
+) -> Iterator[ContentSlide | NonContentSlide]:
+    article = load_article(args.in_path)
+    return iter_slides_from_article(
+        article,
+        load_conversion_example(
+            args.example_source_path, args.example_overview_slide_path
+        ),
+        create_draft_config(args),
+        args.pipeline_workers,
+        (
+            None
+            if args.checkpoint_path is None
+            else Checkpoint(
+                args.checkpoint_path,
+                dc.hash_key(article.primary_markdowns),
+                resume=args.resume,
             )
-        ][1:]
+        ),
     )
 
 
+def slideshow_from_markdown(args: BaseArgs | MainArgs) -> str:
+    return ms.render_deck(s.slide for s in iter_slideshow_from_markdown(args))
+
+
 # %%
 if __name__ == "__main__":
-    result = slideshow_from_markdown(g_main_args)
+    if g_main_args.metrics_path is not None:
+        from media_processing import event_logging
+        from media_processing.llm_metrics import LLMMetricsHandler
+
+        g_metrics_handler = LLMMetricsHandler()
+        g_metrics_handler.install_retry_hook()
+        event_logging.start(g_metrics_handler)
+
     out_dir = Path(g_main_args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
-    with open(out_dir / "output.md", "w", encoding="utf-8") as f:
-        f.write(result)
+    try:
+        with open(out_dir / "output.md", "w", encoding="utf-8") as f:
+            g_writer = ms.DeckWriter(f)
+            for g_slide in iter_slideshow_from_markdown(g_main_args):
+                g_writer.write(g_slide.slide)
+    finally:
+        # Failed and interrupted runs are the ones whose metrics matter most
+        if g_main_args.metrics_path is not None:
+            g_metrics_handler.write(g_main_args.metrics_path)
 
 # %%
@@ -0,0 +1,71 @@
+# %%
+import sys
+from dataclasses import dataclass
+
+from tap import Tap
+
+
+@dataclass(frozen=True)
+class BaseArgs:
+    commands: list[str] | None
+    repeats: int
+    budget_seconds: float
+
+
+class MainArgs(Tap):
+    commands: list[str] | None = None  # Subcommands to time (None = all)
+    repeats: int = 5  # Runs per subcommand; the median is reported
+    budget_seconds: float = 1.0  # Fail if a median startup exceeds this
+
+
+g_main_args = BaseArgs(commands=None, repeats=5, budget_seconds=1.0)
+if __name__ == "__main__" and "ipykernel" not in sys.modules:
+    g_main_args = MainArgs().parse_args()
+
+
+# %%
+import statistics
+import subprocess
+import time
+
+from media_processing.cli import commands
+
+
+def time_command(argv: list[str], repeats: int) -> float:
+    """Median wall time of running `argv` to completion."""
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, check=True)  # noqa: S603
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def startup_benchmark(args: BaseArgs | MainArgs) -> dict[str, float]:
+    """Median seconds to print `--help` per subcommand.
+
+    This covers interpreter start, the dispatcher and every import a
+    subcommand does before parsing its arguments. `python` is the bare
+    interpreter start, for reference.
+    """
+    names = [*commands] if args.commands is None else args.commands
+    cli = [sys.executable, "-m", "media_processing.cli"]
+    return {
+        "python": time_command([sys.executable, "-c", "pass"], args.repeats),
+        "media-processing": time_command([*cli, "--help"], args.repeats),
+        **{name: time_command([*cli, name, "--help"], args.repeats) for name in names},
+    }
+
+
+if __name__ == "__main__":
+    g_timings = startup_benchmark(g_main_args)
+    for g_name, g_seconds in g_timings.items():
+        print(f"{g_name:<24}{g_seconds * 1000:>10.1f} ms")
+    g_over_budget = {
+        name: seconds
+        for name, seconds in g_timings.items()
+        if seconds > g_main_args.budget_seconds
+    }
+    if len(g_over_budget) > 0:
+        print(f"Over the {g_main_args.budget_seconds} s budget: {g_over_budget}")
+        sys.exit(1)
@@ -1,5 +1,6 @@
 # %%
 import sys
+from collections.abc import Sequence
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -13,6 +14,12 @@ class BaseArgs:
     model: str
     language: str | None
     prompt: str | None
+    base_url: str | None
+    chunk_seconds: float | None
+    overlap_seconds: float
+    max_workers: int
+    timestamps: bool
+    worker_socket: str | None
 
 
 def validate_txt_suffix(path: str) -> str:
@@ -21,16 +28,30 @@ def validate_txt_suffix(path: str) -> str:
     return path
 
 
+def validate_chunking(chunk_seconds: float | None, timestamps: bool) -> None:
+    if chunk_seconds is not None and chunk_seconds <= 0:
+        raise ValueError(f"chunk_seconds must be positive, got: {chunk_seconds}")
+    if timestamps and chunk_seconds is None:
+        raise ValueError("timestamps requires chunk_seconds")
+
+
 class MainArgs(Tap):
     in_path: str  # Path to input audio file
     out_path: str  # Path to output text file (must have .txt extension)
     model: str = "openai/whisper-large-v3"  # Transcription model to use
     language: str | None = None  # Language code (optional)
     prompt: str | None = None  # Optional prompt to guide transcription
+    base_url: str | None = None  # API Base URL
+    chunk_seconds: float | None = None  # Split audio into chunks of about this length
+    overlap_seconds: float = 2.0  # Audio shared by neighbouring chunks
+    max_workers: int = 4  # Chunks transcribed concurrently
+    timestamps: bool = False  # Prefix each segment with its start time
+    worker_socket: str | None = None  # Forward the job to a running worker
 
     def process_args(self) -> None:
         super().process_args()
         self.out_path = validate_txt_suffix(self.out_path)
+        validate_chunking(self.chunk_seconds, self.timestamps)
 
 
 g_main_args = BaseArgs(
@@ -39,14 +60,42 @@ g_main_args = BaseArgs(
     model="openai/whisper-large-v3",
     language=None,
     prompt=None,
+    base_url=None,
+    chunk_seconds=None,
+    overlap_seconds=2.0,
+    max_workers=4,
+    timestamps=False,
+    worker_socket=None,
 )
 if __name__ == "__main__" and "ipykernel" not in sys.modules:
     g_main_args = MainArgs().parse_args()
+    if g_main_args.worker_socket is not None:
+        from media_processing import worker
+
+        g_result = worker.submit_job(
+            g_main_args.worker_socket, "transcribe", g_main_args, BaseArgs
+        )
+        print(f"Transcription saved to {g_result['out_path']}")
+        sys.exit(0)
 
 # %%
+import asyncio
 import os
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 
+import stamina
 from together import Together
+from together.error import TogetherException
+
+import media_processing.async_clients as ac
+
+
+def create_client(base_url: str | None) -> Together:
+    return Together(api_key=os.environ.get("TOGETHER_API_KEY"), base_url=base_url)
 
 
 def transcribe_audio(
@@ -54,9 +103,11 @@ def transcribe_audio(
     model: str,
     language: str | None,
     prompt: str | None,
+    base_url: str | None = None,
+    client: Together | None = None,
 ) -> str:
     """Transcribe audio file to text using OpenAI's API."""
-    client = Together(api_key=os.environ.get("TOGETHER_API_KEY"))
+    client = client or create_client(base_url)
 
     with open(audio_path, "rb") as audio_file:
         response = client.audio.transcriptions.create(
@@ -69,24 +120,336 @@ def transcribe_audio(
     return response.text
 
 
-if __name__ == "__main__":
-    input_path = Path(g_main_args.in_path)
+async def transcribe_audio_async(
+    audio_path: str,
+    model: str,
+    language: str | None,
+    prompt: str | None,
+    pool: ac.AsyncClientPool,
+    base_url: str | None = None,
+) -> str:
+    """Like `transcribe_audio`, within the pool's limits and retries."""
+    client = pool.together(base_url)
+
+    async def request() -> str:
+        with open(audio_path, "rb") as audio_file:
+            response = await client.audio.transcriptions.create(
+                file=audio_file,
+                model=model,
+                language=language,
+                prompt=prompt,
+            )
+        return response.text
+
+    return await pool.call(request, on=TogetherException)
+
+
+async def transcribe_files_async(
+    jobs: Sequence[BaseArgs | MainArgs], limits: ac.RequestLimits | None = None
+) -> list[Path]:
+    """Transcribe many files concurrently in one event loop.
+
+    Each file is one request; `chunk_seconds` and `timestamps` are ignored.
+    """
+
+    async def run(job: BaseArgs | MainArgs, pool: ac.AsyncClientPool) -> Path:
+        transcript = await transcribe_audio_async(
+            job.in_path, job.model, job.language, job.prompt, pool, job.base_url
+        )
+        output_path = Path(job.out_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(output_path.write_text, transcript, encoding="utf-8")
+        return output_path
+
+    # A failed job cancels the others before the pool's client is closed
+    async with ac.AsyncClientPool(limits) as pool, asyncio.TaskGroup() as tg:
+        tasks = [tg.create_task(run(job, pool)) for job in jobs]
+    return [task.result() for task in tasks]
+
+
+def run_tool(args: list[str]) -> subprocess.CompletedProcess[str]:
+    """Run an ffmpeg tool with captured text output; no shell is involved."""
+    return subprocess.run(args, capture_output=True, text=True, check=True)  # noqa: S603
+
+
+def probe_duration(audio_path: str) -> float:
+    result = run_tool(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "csv=p=0",
+            audio_path,
+        ]
+    )
+    return float(result.stdout.strip())
+
+
+def detect_silences(
+    audio_path: str, noise_db: float = -35, min_silence_seconds: float = 0.5
+) -> list[tuple[float, float]]:
+    result = run_tool(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-nostats",
+            "-i",
+            audio_path,
+            "-af",
+            f"silencedetect=noise={noise_db}dB:d={min_silence_seconds}",
+            "-f",
+            "null",
+            "-",
+        ]
+    )
+    starts = [float(m) for m in re.findall(r"silence_start: (\S+)", result.stderr)]
+    ends = [float(m) for m in re.findall(r"silence_end: (\S+)", result.stderr)]
+    return [*zip(starts, ends, strict=False)]
+
+
+@dataclass(frozen=True)
+class AudioChunk:
+    start: float
+    cut: float
+    end: float
+
+
+def plan_chunks(
+    duration: float,
+    silences: Sequence[tuple[float, float]],
+    chunk_seconds: float,
+    overlap_seconds: float,
+) -> list[AudioChunk]:
+    """Cut at the latest silence before each chunk limit.
+
+    Each chunk owns `[start, cut)` and is extended by `overlap_seconds` past
+    the cut so words spoken across a cut are heard whole by one of the chunks.
+    """
+    if chunk_seconds <= 0:
+        raise ValueError(f"chunk_seconds must be positive, got: {chunk_seconds}")
+    midpoints = [(start + end) / 2 for start, end in silences]
+    chunks: list[AudioChunk] = []
+    start = 0.0
+    while start < duration:
+        limit = start + chunk_seconds
+        if limit >= duration:
+            cut = duration
+        else:
+            cut = max(
+                (m for m in midpoints if start + chunk_seconds / 2 < m <= limit),
+                default=limit,
+            )
+        chunks.append(AudioChunk(start, cut, min(cut + overlap_seconds, duration)))
+        start = cut
+    return chunks
+
+
+def extract_chunk(audio_path: str, chunk: AudioChunk, out_path: str) -> None:
+    run_tool(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-ss",
+            str(chunk.start),
+            "-to",
+            str(chunk.end),
+            "-i",
+            audio_path,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            "16000",
+            "-c:a",
+            "libmp3lame",
+            "-b:a",
+            "64k",
+            out_path,
+        ]
+    )
+
+
+@dataclass(frozen=True)
+class TranscriptSegment:
+    start: float
+    end: float
+    text: str
+
+
+@dataclass(frozen=True)
+class ChunkTranscript:
+    chunk: AudioChunk
+    segments: Sequence[TranscriptSegment]
+
+
+@stamina.retry(on=TogetherException, attempts=3)
+def transcribe_chunk(
+    client: Together,
+    audio_path: str,
+    chunk: AudioChunk,
+    model: str,
+    language: str | None,
+    prompt: str | None,
+) -> ChunkTranscript:
+    with open(audio_path, "rb") as audio_file:
+        response: Any = client.audio.transcriptions.create(
+            file=audio_file,
+            model=model,
+            language=language,
+            prompt=prompt,
+            response_format="verbose_json",
+            timestamp_granularities="segment",
+        )
+
+    segments = getattr(response, "segments", None) or [
+        {"start": 0.0, "end": chunk.end - chunk.start, "text": response.text}
+    ]
+    return ChunkTranscript(
+        chunk=chunk,
+        segments=[
+            TranscriptSegment(
+                start=chunk.start + _field(segment, "start"),
+                end=chunk.start + _field(segment, "end"),
+                text=str(_field(segment, "text")).strip(),
+            )
+            for segment in segments
+        ],
+    )
+
+
+def _field(segment: Any, name: str) -> Any:
+    return segment[name] if isinstance(segment, dict) else getattr(segment, name)
+
+
+def _seam_overlap(previous: Sequence[str], following: Sequence[str], max_words: int):
+    """Length of the longest word run ending `previous` and starting `following`."""
+
+    def normalize(words: Sequence[str]) -> list[str]:
+        return [re.sub(r"\W", "", word.lower()) for word in words]
+
+    for size in range(min(max_words, len(previous), len(following)), 0, -1):
+        if normalize(previous[-size:]) == normalize(following[:size]):
+            return size
+    return 0
+
+
+def stitch_transcripts(
+    transcripts: Sequence[ChunkTranscript], max_overlap_words: int = 20
+) -> list[TranscriptSegment]:
+    """Merge chunk transcripts, keeping each segment in the chunk that owns it.
+
+    A segment belongs to the chunk whose `[start, cut)` contains its midpoint.
+    Words repeated on both sides of a cut are then dropped from the later
+    segment.
+    """
+    stitched: list[TranscriptSegment] = []
+    for transcript in transcripts:
+        owned = [
+            s
+            for s in transcript.segments
+            if (s.start + s.end) / 2 < transcript.chunk.cut
+            or transcript.chunk.cut >= transcript.chunk.end
+        ]
+        if len(stitched) > 0 and len(owned) > 0:
+            previous_words = stitched[-1].text.split()
+            following_words = owned[0].text.split()
+            overlap = _seam_overlap(previous_words, following_words, max_overlap_words)
+            owned[0] = TranscriptSegment(
+                owned[0].start, owned[0].end, " ".join(following_words[overlap:])
+            )
+        stitched += [s for s in owned if len(s.text) > 0]
+    return stitched
+
+
+def format_timestamp(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:04.1f}"
+
+
+def transcribe_audio_chunked(
+    audio_path: str,
+    model: str,
+    language: str | None,
+    prompt: str | None,
+    chunk_seconds: float,
+    overlap_seconds: float,
+    max_workers: int,
+    base_url: str | None = None,
+    client: Together | None = None,
+) -> list[TranscriptSegment]:
+    """Transcribe long audio as silence-aligned chunks in parallel."""
+    client = client or create_client(base_url)
+    chunks = plan_chunks(
+        probe_duration(audio_path),
+        detect_silences(audio_path),
+        chunk_seconds,
+        overlap_seconds,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        def run(indexed_chunk: tuple[int, AudioChunk]) -> ChunkTranscript:
+            i, chunk = indexed_chunk
+            chunk_path = os.path.join(tmp_dir, f"chunk_{i:05d}.mp3")
+            extract_chunk(audio_path, chunk, chunk_path)
+            return transcribe_chunk(client, chunk_path, chunk, model, language, prompt)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            transcripts = [*executor.map(run, enumerate(chunks))]
+
+    return stitch_transcripts(transcripts)
+
+
+def transcribe_file(args: BaseArgs | MainArgs, client: Together | None = None) -> Path:
+    # Worker jobs are built from `BaseArgs`, which `process_args` never checks
+    validate_chunking(args.chunk_seconds, args.timestamps)
+    input_path = Path(args.in_path)
     if not input_path.exists():
         raise FileNotFoundError(f"Input audio file not found: {input_path}")
 
-    output_path = Path(g_main_args.out_path)
+    output_path = Path(args.out_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    transcript = transcribe_audio(
-        audio_path=str(input_path),
-        model=g_main_args.model,
-        language=g_main_args.language,
-        prompt=g_main_args.prompt,
-    )
+    if args.chunk_seconds is None:
+        transcript = transcribe_audio(
+            audio_path=str(input_path),
+            model=args.model,
+            language=args.language,
+            prompt=args.prompt,
+            base_url=args.base_url,
+            client=client,
+        )
+    else:
+        segments = transcribe_audio_chunked(
+            audio_path=str(input_path),
+            model=args.model,
+            language=args.language,
+            prompt=args.prompt,
+            chunk_seconds=args.chunk_seconds,
+            overlap_seconds=args.overlap_seconds,
+            max_workers=args.max_workers,
+            base_url=args.base_url,
+            client=client,
+        )
+        transcript = (
+            "\n".join(f"[{format_timestamp(s.start)}] {s.text}" for s in segments)
+            if args.timestamps
+            else " ".join(s.text for s in segments)
+        )
 
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(transcript)
+    return output_path
 
-    print(f"Transcription saved to {output_path}")
+
+if __name__ == "__main__":
+    print(f"Transcription saved to {transcribe_file(g_main_args)}")
 
 # %%
@@ -0,0 +1,248 @@
+# %%
+import sys
+from dataclasses import dataclass
+
+from tap import Tap
+
+
+@dataclass(frozen=True)
+class BaseArgs:
+    socket_path: str
+    max_jobs: int
+    preload_whisper_models: list[str]
+    whisper_device: str
+    whisper_compute_type: str
+
+
+class MainArgs(Tap):
+    socket_path: str = "~/.media-processing.sock"  # Unix socket to listen on
+    max_jobs: int = 8  # Jobs run at the same time; later ones wait
+    preload_whisper_models: list[str] = []  # Whisper models to load on start
+    whisper_device: str = "auto"  # Device for local Whisper models
+    whisper_compute_type: str = "default"  # CTranslate2 compute type for Whisper
+
+
+g_main_args = BaseArgs(
+    socket_path="~/.media-processing.sock",
+    max_jobs=8,
+    preload_whisper_models=[],
+    whisper_device="auto",
+    whisper_compute_type="default",
+)
+if __name__ == "__main__" and "ipykernel" not in sys.modules:
+    g_main_args = MainArgs().parse_args()
+
+
+# %%
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+from dataclasses import fields
+from pathlib import Path
+from typing import Any
+
+# Job messages are single JSON lines: `{"op": ..., "args": {...}}` answered by
+# `{"ok": true, "result": {...}}` or `{"ok": false, "error": "..."}`. Paths in
+# job arguments are absolute, as the worker does not share the caller's cwd.
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def absolute_paths(args: dict[str, Any]) -> dict[str, Any]:
+    return {
+        name: (
+            str(Path(value).resolve())
+            if isinstance(value, str) and name.endswith(("_path", "_dir"))
+            else value
+        )
+        for name, value in args.items()
+    }
+
+
+def submit(
+    socket_path: str, op: str, args: dict[str, Any], timeout: float | None = None
+) -> dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(os.path.expanduser(socket_path))
+        sock.sendall(json.dumps({"op": op, "args": args}).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if len(line) == 0:
+        raise WorkerError("Worker closed the connection without a response")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise WorkerError(response["error"])
+    return response["result"]
+
+
+def submit_job(socket_path: str, op: str, args: Any, args_type: type) -> dict[str, Any]:
+    """Forward parsed CLI arguments as the fields of the module's `BaseArgs`."""
+    job_args = {
+        f.name: getattr(args, f.name)
+        for f in fields(args_type)
+        if f.name != "worker_socket"
+    }
+    return submit(socket_path, op, absolute_paths(job_args))
+
+
+class WorkerState:
+    """Clients, caches and models shared by every job of the worker.
+
+    API clients keep their HTTP connection pools, so jobs after the first
+    skip the TLS handshake; all of them are safe to share between threads.
+    """
+
+    def __init__(self, whisper_device: str, whisper_compute_type: str):
+        self.whisper_device = whisper_device
+        self.whisper_compute_type = whisper_compute_type
+        self._lock = threading.Lock()
+        self._shared: dict[tuple[Any, ...], Any] = {}
+
+    def _get_or_create(self, key: tuple[Any, ...], create) -> Any:
+        with self._lock:
+            if key not in self._shared:
+                self._shared[key] = create()
+            return self._shared[key]
+
+    def together(self, base_url: str | None) -> Any:
+        import media_processing.transcribe as tr
+
+        return self._get_or_create(
+            ("together", base_url), lambda: tr.create_client(base_url)
+        )
+
+    def openai(self, base_url: str | None) -> Any:
+        from openai import OpenAI
+
+        return self._get_or_create(
+            ("openai", base_url), lambda: OpenAI(base_url=base_url)
+        )
+
+    def disk_cache(self, directory: str | None, max_bytes: int) -> Any:
+        if directory is None:
+            return None
+        import media_processing.disk_cache as dc
+
+        return self._get_or_create(
+            ("disk_cache", directory, max_bytes),
+            lambda: dc.DiskCache(directory, max_bytes),
+        )
+
+    def whisper_model(self, model: str) -> Any:
+        # Loading holds the lock, so concurrent jobs never load a model twice
+        from faster_whisper import WhisperModel
+
+        return self._get_or_create(
+            ("whisper", model),
+            lambda: WhisperModel(
+                model,
+                device=self.whisper_device,
+                compute_type=self.whisper_compute_type,
+            ),
+        )
+
+
+def transcribe_local(state: WorkerState, args: dict[str, Any]) -> dict[str, Any]:
+    """Transcribe with a local Whisper model that stays loaded between jobs."""
+    model = state.whisper_model(args.get("model", "large-v2"))
+    segments, _ = model.transcribe(args["in_path"], language=args.get("language"))
+    output_path = Path(args["out_path"])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(" ".join(s.text.strip() for s in segments), encoding="utf-8")
+    return {"out_path": str(output_path)}
+
+
+def run_job(state: WorkerState, op: str, args: dict[str, Any]) -> dict[str, Any]:
+    match op:
+        case "ping":
+            return {}
+        case "transcribe":
+            import media_processing.transcribe as tr
+
+            job = tr.BaseArgs(**args, worker_socket=None)
+            path = tr.transcribe_file(job, state.together(job.base_url))
+            return {"out_path": str(path)}
+        case "tts":
+            import media_processing.mp3_from_tts as tts
+
+            job = tts.BaseArgs(**args, worker_socket=None)
+            path = tts.mp3_file_from_tts(
+                job,
+                state.openai(job.base_url),
+                state.disk_cache(job.cache_dir, job.cache_max_bytes),
+            )
+            return {"out_path": str(path)}
+        case "transcribe_local":
+            return transcribe_local(state, args)
+        case _:
+            raise ValueError(f"Unknown job op: {op}")
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    server: "WorkerServer"
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                with self.server.job_slots:
+                    result = run_job(
+                        self.server.state, request["op"], request.get("args", {})
+                    )
+                response = {"ok": True, "result": result}
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class WorkerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, state: WorkerState, max_jobs: int):
+        self.state = state
+        self.job_slots = threading.BoundedSemaphore(max_jobs)
+        super().__init__(socket_path, JobHandler)
+
+
+def serve(args: BaseArgs | MainArgs) -> None:
+    socket_path = Path(args.socket_path).expanduser()
+    if socket_path.exists():
+        try:
+            submit(str(socket_path), "ping", {}, timeout=1)
+        except (OSError, WorkerError):
+            socket_path.unlink()
+        else:
+            raise WorkerError(f"A worker is already listening on {socket_path}")
+    state = WorkerState(args.whisper_device, args.whisper_compute_type)
+    for model in args.preload_whisper_models:
+        state.whisper_model(model)
+
+    # Jobs read and write files as this user, so nobody else may submit. The
+    # umask makes the socket private from the moment it is bound
+    old_umask = os.umask(0o177)
+    try:
+        server = WorkerServer(str(socket_path), state, args.max_jobs)
+    finally:
+        os.umask(old_umask)
+    with server:
+        print(f"Worker listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    # Service managers stop workers with SIGTERM; exit cleanly to remove the socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        serve(g_main_args)
+    except KeyboardInterrupt:
+        pass
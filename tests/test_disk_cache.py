@@ -0,0 +1,50 @@
+import os
+
+from media_processing import disk_cache as dc
+
+
+def test_eviction_frees_down_to_low_water_mark(tmp_path, monkeypatch):
+    cache = dc.DiskCache(tmp_path, max_bytes=100)
+    for i in range(10):
+        cache.put(f"k{i}", b"x" * 10)
+        os.utime(tmp_path / f"k{i}.bin", (i, i))
+    listings = []
+    entries = cache._entries
+
+    def counted_entries():
+        listings.append(1)
+        return entries()
+
+    monkeypatch.setattr(cache, "_entries", counted_entries)
+
+    cache.put("k10", b"x" * 10)
+    assert cache.get("k0") is None
+    assert cache.get("k1") is None
+    assert cache.get("k2") == b"x" * 10
+    assert cache._total_bytes == 90
+    # The freed headroom absorbs the next write without another listing
+    cache.put("k11", b"x" * 10)
+    assert len(listings) == 1
+
+
+def test_get_misses_entries_evicted_while_reading(tmp_path, monkeypatch):
+    cache = dc.DiskCache(tmp_path, max_bytes=100)
+    cache.put("key", b"data")
+
+    def evicted_utime(path, *args):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(dc.os, "utime", evicted_utime)
+    assert cache.get("key") is None
+
+
+def test_read_only_cache_never_writes(tmp_path):
+    dc.DiskCache(tmp_path, max_bytes=100).put("key", b"data")
+    mtime = (tmp_path / "key.bin").stat().st_mtime_ns
+
+    cache = dc.DiskCache(tmp_path, max_bytes=1, read_only=True)
+    cache.put("other", b"data")
+    assert cache.get("key") == b"data"
+    assert cache.get("other") is None
+    assert (tmp_path / "key.bin").stat().st_mtime_ns == mtime
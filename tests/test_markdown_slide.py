@@ -0,0 +1,39 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from media_processing.slideshow import markdown_slide as ms
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_json_object_spans_match_recursive_regex(seed: int):
+    regex = pytest.importorskip("regex")
+
+    rng = random.Random(seed)
+    for _ in range(100):
+        text = "".join(rng.choices("{}ab ", k=rng.randint(0, 40)))
+        expected = [m.span() for m in regex.finditer(r"{(?:[^{}]|(?R))*}", text)]
+        assert [*ms.iter_json_object_spans(text)] == expected
+        assert ms.rfind_json_object_span(text) == (expected[-1] if expected else None)
+
+
+def test_json_object_spans_skip_braces_in_strings():
+    text = 'It\'s {"a": "}{", "b": {"c": "\\"}"}} and {x'
+    end = text.index(" and")
+    assert [*ms.iter_json_object_spans(text)] == [(text.index("{"), end)]
+
+
+def test_front_matter_slides_render_concurrently():
+    def render(worker: int) -> list[str]:
+        return [
+            ms.MarkdownSlide.from_markdown(
+                f"---\nlayout: center\nid: {worker}-{i}\n---\n# Slide {i}\n\nText"
+            ).markdown
+            for i in range(200)
+        ]
+
+    expected = [render(worker) for worker in range(4)]
+    ms.MarkdownSlide.from_markdown.__func__.cache_clear()
+    with ThreadPoolExecutor(4) as executor:
+        assert [*executor.map(render, range(4))] == expected
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("openai")
+
+from media_processing import mp3_from_tts as tts
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, no CRC: 144 * 128000 // 44100 bytes
+STEREO_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+MONO_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+FRAME_LENGTH = 417
+
+
+def frame(header: bytes = STEREO_HEADER, tag: bytes = b"", offset: int = 0) -> bytes:
+    body = bytearray(FRAME_LENGTH - len(header))
+    body[offset - len(header) : offset - len(header) + len(tag)] = tag
+    return header + bytes(body)
+
+
+def id3v2(size: int, footer: bool = False) -> bytes:
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    flags = 0x10 if footer else 0
+    return (
+        b"ID3"
+        + bytes([4, 0, flags])
+        + syncsafe
+        + b"t" * size
+        + (b"3DI" + bytes(7) if footer else b"")
+    )
+
+
+@pytest.mark.parametrize("footer", [False, True])
+def test_strip_id3_tags_drops_id3v2_header(footer: bool):
+    audio = frame()
+    assert tts.strip_id3_tags(id3v2(200, footer) + audio) == audio
+
+
+def test_strip_id3_tags_drops_id3v1_trailer():
+    audio = frame()
+    assert tts.strip_id3_tags(audio + b"TAG" + bytes(125)) == audio
+
+
+def test_strip_id3_tags_keeps_untagged_audio():
+    audio = frame() * 2
+    assert tts.strip_id3_tags(audio) == audio
+
+
+@pytest.mark.parametrize(
+    ("header", "tag", "offset"),
+    [
+        (STEREO_HEADER, b"Xing", 36),
+        (STEREO_HEADER, b"Info", 36),
+        (MONO_HEADER, b"Info", 21),
+        (STEREO_HEADER, b"VBRI", 36),
+    ],
+)
+def test_strip_vbr_header_drops_the_tag_frame(header: bytes, tag: bytes, offset: int):
+    audio = frame() * 2
+    assert tts.strip_vbr_header(frame(header, tag, offset) + audio) == audio
+
+
+def test_strip_vbr_header_keeps_plain_frames():
+    audio = frame() * 2
+    assert tts.strip_vbr_header(audio) == audio
+    # A tag anywhere but right after the side information is just audio data
+    audio = frame(MONO_HEADER, b"Xing", 36) + frame()
+    assert tts.strip_vbr_header(audio) == audio
+
+
+def test_mp3_frames_strips_tags_then_the_vbr_frame():
+    audio = frame() * 2
+    segment = id3v2(20) + frame(tag=b"Info", offset=36) + audio
+    assert tts.mp3_frames(segment) == audio
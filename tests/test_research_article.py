@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from media_processing import research_article as ra
+
+
+def random_markdown(rng: random.Random) -> str:
+    """Blank-line separated blocks, as articles converted from PDFs are.
+
+    Headings are always followed by a blank line: `MarkdownNodeParser`
+    otherwise reads the next line as part of the title.
+    """
+    words = ["alpha", "beta", "1.2", "#tag", "x", "Methods", "Results"]
+
+    def line() -> str:
+        return " ".join(rng.choices(words, k=rng.randint(1, 4)))
+
+    blocks = []
+    for _ in range(rng.randint(0, 12)):
+        match rng.randrange(5):
+            case 0:
+                blocks.append(f"{'#' * rng.randint(1, 3)} {line()}\n")
+            case 1:
+                body = [f"# {line()}" if rng.random() < 0.5 else line()]
+                blocks.append("\n".join(["```python", *body, "```"]))
+            case 2:
+                blocks.append("\n".join(f"    {line()}" for _ in range(2)))
+            case 3:
+                blocks.append("\n".join(line() for _ in range(rng.randint(1, 3))))
+            case _:
+                blocks.append("")
+    return "\n\n".join(blocks)
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_sections_from_markdown_match_node_parser(seed: int):
+    node_parser = pytest.importorskip("llama_index.core.node_parser")
+    schema = pytest.importorskip("llama_index.core.schema")
+
+    text = random_markdown(random.Random(seed))
+    nodes = node_parser.MarkdownNodeParser().get_nodes_from_documents(
+        [schema.Document(text=text)]
+    )
+    assert ra.sections_from_markdown(text) == ra.sections_from_nodes(nodes)
+
+
+def test_read_markdown(tmp_path):
+    path = tmp_path / "article.md"
+    path.write_text("# Title\n\n    indented\n", encoding="utf-8")
+    assert ra.read_markdown(path) == "# Title\n\n    indented\n"
+    assert ra.sections_from_markdown(ra.read_markdown(path)) == [
+        ra.Section(level=1, title="Title", content="    indented")
+    ]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_window_until_threshold_matches_linear_walk(seed: int):
+    rng = random.Random(seed)
+    sections = [
+        ra.Section(level=rng.choice([1, 1, 2, 3]), title="T", content="x" * n)
+        for n in rng.choices(range(0, 8), k=rng.randint(0, 20))
+    ]
+    article = ra.ResearchArticle(primary_sections=sections, supportive_sections=[])
+    for start in range(len(sections) + 1):
+        min_chars = rng.randint(0, 60)
+        lookahead_chars = rng.randint(0, 30)
+        window = article.window_until_threshold(start, min_chars, lookahead_chars)
+        assert sections[window.start : window.stop] == (
+            ra.get_sections_until_threshold(
+                sections[start:], min_chars, lookahead_chars
+            )
+        )
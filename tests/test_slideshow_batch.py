@@ -0,0 +1,62 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from media_processing import slideshow_batch as sbatch
+from media_processing import slideshow_benchmark as sb
+from media_processing import slideshow_from_markdown as sfm
+from media_processing.slideshow import markdown_slide as ms
+
+
+def convert(article_path: Path, out_dir: Path) -> str:
+    config = sfm.DraftConfig(
+        llm=sb.FakeSlideLLM(),
+        system_prompt=sfm.system_prompt,
+        cache=None,
+        count_tokens=lambda text: len(text) // 4,
+        context_token_budget=3000,
+    )
+    example = sfm.ConversionExample(
+        opening_text=sb.synthetic_article(2, seed=1), overview_slide="# Overview"
+    )
+    result = sbatch.convert_article(article_path, out_dir, example, config, 1)
+    assert result.error is None, result.error
+    return Path(result.out_path).read_text(encoding="utf-8")
+
+
+def test_concurrent_articles_match_serial_conversion(tmp_path):
+    article_paths = [tmp_path / "a.md", tmp_path / "b.md"]
+    for seed, path in enumerate(article_paths):
+        path.write_text(sb.synthetic_article(100, seed=seed), encoding="utf-8")
+    serial = [convert(path, tmp_path / "serial" / path.stem) for path in article_paths]
+
+    # Switching threads often makes rendering races show up reliably
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for run in range(3):
+            ms.MarkdownSlide.from_markdown.__func__.cache_clear()
+            with ThreadPoolExecutor(2) as executor:
+                decks = executor.map(
+                    lambda path, run=run: convert(
+                        path, tmp_path / f"{run}" / path.stem
+                    ),
+                    article_paths,
+                )
+                assert [*decks] == serial
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_article_out_dirs_keep_same_named_articles_apart(tmp_path):
+    paths = [tmp_path / "a" / "paper.md", tmp_path / "b" / "paper.md"]
+    assert sbatch.article_out_dirs(paths, tmp_path / "out") == [
+        tmp_path / "out" / "a" / "paper",
+        tmp_path / "out" / "b" / "paper",
+    ]
+    with pytest.raises(ValueError):
+        sbatch.article_out_dirs([paths[0], paths[0]], tmp_path / "out")
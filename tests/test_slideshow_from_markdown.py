@@ -0,0 +1,43 @@
+import sys
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from media_processing import slideshow_benchmark as sb
+from media_processing import slideshow_from_markdown as sfm
+from media_processing.slideshow import markdown_slide as ms
+
+
+def draft_deck(article_path: str, pipeline_workers: int) -> str:
+    config = sfm.DraftConfig(
+        llm=sb.FakeSlideLLM(latency_seconds=0.0),
+        system_prompt=sfm.system_prompt,
+        cache=None,
+        count_tokens=lambda text: len(text) // 4,
+        context_token_budget=3000,
+    )
+    example = sfm.ConversionExample(
+        opening_text=sb.synthetic_article(2, seed=1), overview_slide="# Overview"
+    )
+    slides = sfm.iter_slides_from_article(
+        sfm.load_article(article_path), example, config, pipeline_workers
+    )
+    return ms.render_deck(s.slide for s in slides)
+
+
+def test_pipelined_deck_matches_serial_deck(tmp_path):
+    article_path = tmp_path / "article.md"
+    article_path.write_text(sb.synthetic_article(200), encoding="utf-8")
+
+    serial = draft_deck(str(article_path), 1)
+    assert serial.count("layout: center") > 1
+    # Switching threads often makes rendering races show up reliably
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(3):
+            ms.MarkdownSlide.from_markdown.__func__.cache_clear()
+            assert draft_deck(str(article_path), 8) == serial
+    finally:
+        sys.setswitchinterval(switch_interval)
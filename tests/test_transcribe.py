@@ -0,0 +1,98 @@
+import random
+from itertools import pairwise
+
+import pytest
+
+pytest.importorskip("together")
+
+from media_processing import transcribe as tr
+
+
+@pytest.mark.parametrize(
+    ("chunk_seconds", "timestamps"), [(0, False), (-5, False), (None, True)]
+)
+def test_validate_chunking_rejects(chunk_seconds, timestamps):
+    with pytest.raises(ValueError):
+        tr.validate_chunking(chunk_seconds, timestamps)
+
+
+@pytest.mark.parametrize(("chunk_seconds", "timestamps"), [(None, False), (30, True)])
+def test_validate_chunking_accepts(chunk_seconds, timestamps):
+    tr.validate_chunking(chunk_seconds, timestamps)
+
+
+def test_plan_chunks_keeps_short_audio_whole():
+    assert tr.plan_chunks(30, [], 60, 2) == [tr.AudioChunk(0, 30, 30)]
+
+
+def test_plan_chunks_overlaps_cuts_and_shortens_the_last_chunk():
+    assert tr.plan_chunks(150, [], 60, 2) == [
+        tr.AudioChunk(0, 60, 62),
+        tr.AudioChunk(60, 120, 122),
+        tr.AudioChunk(120, 150, 150),
+    ]
+
+
+def test_plan_chunks_cuts_at_late_silences_only():
+    # The silence at 11 s is in the first half of the chunk and is passed over
+    assert tr.plan_chunks(120, [(10, 12), (40, 42)], 60, 2) == [
+        tr.AudioChunk(0, 41, 43),
+        tr.AudioChunk(41, 101, 103),
+        tr.AudioChunk(101, 120, 120),
+    ]
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_plan_chunks_cover_the_audio(seed: int):
+    rng = random.Random(seed)
+    duration = rng.uniform(1, 600)
+    silences = sorted((s, s + 0.5) for s in rng.choices(range(600), k=20))
+    chunk_seconds = rng.uniform(5, 120)
+    chunks = tr.plan_chunks(duration, silences, chunk_seconds, 1.5)
+
+    assert chunks[0].start == 0
+    assert chunks[-1].cut == chunks[-1].end == duration
+    for chunk, following in pairwise(chunks):
+        assert following.start == chunk.cut
+        assert chunk.end == min(chunk.cut + 1.5, duration)
+    for chunk in chunks[:-1]:
+        assert (
+            chunk.start + chunk_seconds / 2 < chunk.cut <= chunk.start + chunk_seconds
+        )
+
+
+def segment(start: float, end: float, text: str) -> tr.TranscriptSegment:
+    return tr.TranscriptSegment(start, end, text)
+
+
+def test_stitch_keeps_a_single_chunk_as_is():
+    chunk = tr.AudioChunk(0, 30, 30)
+    segments = [segment(0, 10, "Hello there."), segment(10, 30, "General Kenobi.")]
+    assert tr.stitch_transcripts([tr.ChunkTranscript(chunk, segments)]) == segments
+
+
+def test_stitch_drops_segments_past_the_cut_and_repeated_words():
+    first = tr.ChunkTranscript(
+        tr.AudioChunk(0, 60, 62),
+        [segment(0, 59, "The quick brown"), segment(59.5, 62, "fox")],
+    )
+    second = tr.ChunkTranscript(
+        tr.AudioChunk(60, 90, 90),
+        [segment(58, 63, "Brown, fox jumps"), segment(63, 90, "over the dog.")],
+    )
+    assert tr.stitch_transcripts([first, second]) == [
+        segment(0, 59, "The quick brown"),
+        segment(58, 63, "fox jumps"),
+        segment(63, 90, "over the dog."),
+    ]
+
+
+def test_stitch_drops_segments_left_empty_by_deduplication():
+    first = tr.ChunkTranscript(tr.AudioChunk(0, 60, 62), [segment(0, 59, "a b c")])
+    second = tr.ChunkTranscript(
+        tr.AudioChunk(60, 90, 90), [segment(59, 62, "b c"), segment(62, 90, "d")]
+    )
+    assert tr.stitch_transcripts([first, second]) == [
+        segment(0, 59, "a b c"),
+        segment(62, 90, "d"),
+    ]